@@ -0,0 +1,124 @@
+from functools import lru_cache
+from sqlalchemy import case, event, text
+from database import db
+from models import GradePoint, Student, Professor, Course, Enrollment
+from versions import get_versions
+
+# Standard 4.0 scale; grades that do not count toward GPA still show up in histograms
+GRADE_POINTS = [
+    ('A+', 4.0, True), ('A', 4.0, True), ('A-', 3.7, True),
+    ('B+', 3.3, True), ('B', 3.0, True), ('B-', 2.7, True),
+    ('C+', 2.3, True), ('C', 2.0, True), ('C-', 1.7, True),
+    ('D+', 1.3, True), ('D', 1.0, True), ('D-', 0.7, True),
+    ('F', 0.0, True),
+    ('P', 0.0, False), ('NP', 0.0, False), ('W', 0.0, False), ('I', 0.0, False),
+]
+ANALYTICS_CACHE_SIZE = 256
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _seed_grade_points(metadata, connection, **kw):
+    # Missing grades are added; edited point values are left alone
+    connection.execute(
+        text("INSERT OR IGNORE INTO grade_point (grade, points, counts_toward_gpa) VALUES (:grade, :points, :counts)"),
+        [{'grade': grade, 'points': points, 'counts': counts} for grade, points, counts in GRADE_POINTS]
+    )
+
+
+# Enrollment grades are free-form text, so they are matched case- and whitespace-insensitively
+normalized_grade = db.func.upper(db.func.trim(Enrollment.grade))
+_grade_join = GradePoint.grade == normalized_grade
+_gpa_credits = case((GradePoint.counts_toward_gpa, Course.credits), else_=0)
+_quality_points = case((GradePoint.counts_toward_gpa, GradePoint.points * Course.credits), else_=0)
+
+
+def _gpa(quality_points, credits):
+    return round(quality_points / credits, 2) if credits else None
+
+
+def cached(*tables):
+    # Results are memoised against the versions of exactly the tables the report reads
+    def decorator(function):
+        memo = lru_cache(maxsize=ANALYTICS_CACHE_SIZE)(lambda versions, *args: function(*args))
+
+        def wrapper(*args):
+            return memo(tuple(get_versions(tables).values()), *args)
+        wrapper.cache_clear = memo.cache_clear
+        return wrapper
+    return decorator
+
+
+@cached('student', 'enrollment', 'course', 'grade_point')
+def transcript(student_id):
+    student = db.session.get(Student, student_id)
+    if student is None:
+        return None
+    rows = db.session.execute(
+        db.select(Course.id, Course.code, Course.name, Course.credits, Enrollment.grade,
+                  GradePoint.points, GradePoint.counts_toward_gpa)
+        .join(Course, Course.id == Enrollment.course_id)
+        .outerjoin(GradePoint, _grade_join)
+        .where(Enrollment.student_id == student_id)
+        .order_by(Course.code)
+    ).all()
+    courses = []
+    quality_points = gpa_credits = 0
+    for course_id, code, name, credits, grade, points, counts in rows:
+        courses.append({'course_id': course_id, 'code': code, 'name': name, 'credits': credits,
+                        'grade': grade, 'points': points if counts else None})
+        if counts:
+            quality_points += points * credits
+            gpa_credits += credits
+    return {'student_id': student.id, 'name': student.name, 'major': student.major,
+            'courses': courses, 'gpa_credits': gpa_credits, 'gpa': _gpa(quality_points, gpa_credits)}
+
+
+def _histogram(condition):
+    rows = db.session.execute(
+        db.select(normalized_grade, db.func.count(), GradePoint.points)
+        .select_from(Enrollment)
+        .join(Course, Course.id == Enrollment.course_id)
+        .outerjoin(GradePoint, _grade_join)
+        .where(condition)
+        .group_by(normalized_grade)
+        .order_by(GradePoint.points.desc().nulls_last(), normalized_grade)
+    ).all()
+    return [{'grade': grade, 'count': count} for grade, count, _ in rows]
+
+
+@cached('enrollment', 'course', 'grade_point')
+def course_grades(course_id):
+    return _histogram(Enrollment.course_id == course_id)
+
+
+@cached('enrollment', 'course', 'grade_point')
+def professor_grades(professor_id):
+    return _histogram(Course.professor_id == professor_id)
+
+
+@cached('enrollment', 'course', 'professor', 'grade_point')
+def department_averages():
+    # Enrollments collapse to one row per (course, grade) first, so the joins and the
+    # department grouping work on a few thousand rows rather than every enrollment
+    per_course = (
+        db.select(Enrollment.course_id, Enrollment.grade, db.func.count().label('enrollments'))
+        .group_by(Enrollment.course_id, Enrollment.grade)
+        .subquery()
+    )
+    grade_join = GradePoint.grade == db.func.upper(db.func.trim(per_course.c.grade))
+    rows = db.session.execute(
+        db.select(Professor.department,
+                  db.func.sum(per_course.c.enrollments),
+                  db.func.sum(case((GradePoint.grade.is_not(None), per_course.c.enrollments), else_=0)),
+                  db.func.sum(_quality_points * per_course.c.enrollments),
+                  db.func.sum(_gpa_credits * per_course.c.enrollments))
+        .select_from(per_course)
+        .join(Course, Course.id == per_course.c.course_id)
+        .join(Professor, Professor.id == Course.professor_id)
+        .outerjoin(GradePoint, grade_join)
+        .group_by(Professor.department)
+        .order_by(Professor.department)
+    ).all()
+    return [{'department': department, 'enrollments': enrollments, 'graded': graded,
+             'gpa_credits': credits or 0, 'average_gpa': _gpa(quality_points or 0, credits)}
+            for department, enrollments, graded, quality_points, credits in rows]
@@ -0,0 +1,214 @@
+import json
+from datetime import datetime
+from flask import Blueprint, Response, request, abort, stream_with_context
+from sqlalchemy.orm import joinedload, selectinload, load_only
+from werkzeug.exceptions import HTTPException
+from models import Student, Professor, Course, Enrollment, TuitionPayment
+from pagination import keyset_paginate, MAX_PER_PAGE
+from query_budget import query_budget
+from versions import conditional
+from university import STUDENT_SORTS, PROFESSOR_SORTS, COURSE_SORTS, ENROLLMENT_SORTS, PAYMENT_SORTS
+
+try:
+    import orjson
+except ImportError:  # orjson is optional: the standard library serializer is used instead
+    orjson = None
+
+api_bp = Blueprint('api', __name__)
+
+STREAM_CHUNK_SIZE = 1000
+
+
+class ApiResource:
+    def __init__(self, model, fields, sorts, filters=None, relations=None):
+        self.model = model
+        # The mapped attribute, as in the sort maps: keyset_paginate compares them by identity
+        self.pk = getattr(model, model.__mapper__.primary_key[0].key)
+        self.fields = fields
+        self.sorts = sorts
+        # ?<name>=value equality filters
+        self.filters = filters or {}
+        # ?include=<relationship> -> name of the related resource
+        self.relations = relations or {}
+
+    @property
+    def tables(self):
+        names = [self.model.__table__.name]
+        names += [API_RESOURCES[target].model.__table__.name for target in self.relations.values()]
+        return sorted(set(names))
+
+
+API_RESOURCES = {
+    'students': ApiResource(Student, ['id', 'name', 'email', 'major'], STUDENT_SORTS,
+                            filters={'major': Student.major},
+                            relations={'enrollments': 'enrollments', 'payments': 'payments'}),
+    'professors': ApiResource(Professor, ['id', 'name', 'email', 'department'], PROFESSOR_SORTS,
+                              filters={'department': Professor.department},
+                              relations={'courses': 'courses'}),
+    'courses': ApiResource(Course, ['id', 'name', 'code', 'credits', 'professor_id'], COURSE_SORTS,
+                           filters={'professor': Course.professor_id, 'code': Course.code},
+                           relations={'professor': 'professors', 'enrollments': 'enrollments'}),
+    'enrollments': ApiResource(Enrollment, ['id', 'student_id', 'course_id', 'grade'], ENROLLMENT_SORTS,
+                               filters={'student': Enrollment.student_id, 'course': Enrollment.course_id},
+                               relations={'student': 'students', 'course': 'courses'}),
+    'payments': ApiResource(TuitionPayment, ['id', 'student_id', 'course_id', 'amount_paid', 'payment_date', 'status'],
+                            PAYMENT_SORTS,
+                            filters={'status': TuitionPayment.status, 'student': TuitionPayment.student_id,
+                                     'course': TuitionPayment.course_id},
+                            relations={'student': 'students', 'course': 'courses'}),
+}
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(value):
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(',', ':'), default=_default).encode('utf-8')
+
+
+def json_response(value, status=200):
+    return Response(dumps(value), status=status, mimetype='application/json')
+
+
+def _list_arg(name):
+    return [v for v in request.args.get(name, '').split(',') if v]
+
+
+def _requested_fields(resource):
+    fields = _list_arg('fields')
+    unknown = set(fields) - set(resource.fields)
+    if unknown:
+        abort(400, f"Unknown fields: {', '.join(sorted(unknown))}")
+    if not fields:
+        return resource.fields
+    return ['id'] + [f for f in resource.fields if f in fields and f != 'id']
+
+
+def _requested_includes(resource):
+    includes = _list_arg('include')
+    unknown = set(includes) - set(resource.relations)
+    if unknown:
+        abort(400, f"Unknown relations: {', '.join(sorted(unknown))}")
+    return includes
+
+
+def _coerce_id(resource, value):
+    try:
+        return resource.pk.type.python_type(value)
+    except ValueError:
+        abort(400, f"Invalid id: {value}")
+
+
+def _query(resource, fields, includes):
+    model = resource.model
+    query = model.query.options(load_only(*[getattr(model, f) for f in fields]))
+    for name in includes:
+        relationship = getattr(model, name)
+        # Collections come in one extra IN query, parents in the same query: never one per row
+        query = query.options(selectinload(relationship) if relationship.property.uselist else joinedload(relationship))
+    for arg, column in resource.filters.items():
+        if request.args.get(arg):
+            query = query.filter(column == request.args[arg])
+    return query
+
+
+def _serializer(resource, fields, includes):
+    embedded = {name: API_RESOURCES[resource.relations[name]].fields for name in includes}
+
+    def serialize(obj):
+        row = {f: getattr(obj, f) for f in fields}
+        for name, related_fields in embedded.items():
+            value = getattr(obj, name)
+            if isinstance(value, list):
+                row[name] = [{f: getattr(item, f) for f in related_fields} for item in value]
+            else:
+                row[name] = {f: getattr(value, f) for f in related_fields} if value is not None else None
+        return row
+    return serialize
+
+
+def _chunks(query):
+    chunk = []
+    for obj in query.yield_per(STREAM_CHUNK_SIZE):
+        chunk.append(obj)
+        if len(chunk) == STREAM_CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _ndjson(query, serialize):
+    for rows in _chunks(query):
+        yield b''.join(dumps(serialize(obj)) + b'\n' for obj in rows)
+
+
+def list_resource(name):
+    resource = API_RESOURCES[name]
+    fields = _requested_fields(resource)
+    includes = _requested_includes(resource)
+    query = _query(resource, fields, includes)
+    serialize = _serializer(resource, fields, includes)
+
+    ids = _list_arg('ids')
+    if ids:
+        # Bulk fetch: one IN query, results in the order asked for
+        if len(ids) > MAX_PER_PAGE:
+            abort(400, f"At most {MAX_PER_PAGE} ids per request")
+        ids = [_coerce_id(resource, value) for value in ids]
+        found = {getattr(obj, resource.pk.key): obj for obj in query.filter(resource.pk.in_(ids))}
+        return json_response({'data': [serialize(found[i]) for i in ids if i in found],
+                              'missing': [i for i in ids if i not in found]})
+
+    if request.args.get('format') == 'ndjson' or request.accept_mimetypes.best == 'application/x-ndjson':
+        # Every matching row, streamed in primary key order with flat memory
+        query = query.order_by(resource.pk)
+        return Response(stream_with_context(_ndjson(query, serialize)), mimetype='application/x-ndjson')
+
+    page = keyset_paginate(query, resource.sorts, resource.pk, request.args)
+    return json_response({'data': [serialize(obj) for obj in page.items],
+                          'next': page.next_cursor, 'prev': page.prev_cursor})
+
+
+def get_resource(name, id):
+    resource = API_RESOURCES[name]
+    fields = _requested_fields(resource)
+    includes = _requested_includes(resource)
+    obj = _query(resource, fields, includes).filter(resource.pk == _coerce_id(resource, id)).first()
+    if obj is None:
+        abort(404)
+    return json_response({'data': _serializer(resource, fields, includes)(obj)})
+
+
+@api_bp.route('/')
+def api_index():
+    return json_response({name: {'fields': resource.fields, 'sorts': sorted(resource.sorts),
+                                 'filters': sorted(resource.filters), 'include': sorted(resource.relations)}
+                          for name, resource in API_RESOURCES.items()})
+
+
+@api_bp.errorhandler(HTTPException)
+def api_error(error):
+    return json_response({'error': error.name, 'message': error.description}, status=error.code)
+
+
+def _register(name, resource):
+    def list_view():
+        return list_resource(name)
+
+    def detail_view(id):
+        return get_resource(name, id)
+
+    # One query for the rows plus one per embedded collection, after the version lookup
+    budget = 2 + sum(getattr(resource.model, r).property.uselist for r in resource.relations)
+    api_bp.add_url_rule(f'/{name}', f'list_{name}', query_budget(budget)(conditional(*resource.tables)(list_view)))
+    api_bp.add_url_rule(f'/{name}/<id>', f'get_{name}', query_budget(budget)(conditional(*resource.tables)(detail_view)))
+
+
+for _name, _resource in API_RESOURCES.items():
+    _register(_name, _resource)
@@ -1,29 +1,66 @@
 import os
 from flask import Flask, render_template
-from database import db
+from sqlalchemy.engine import make_url
+from database import db, configure_engine
+from instrumentation import init_instrumentation
+from assets import init_assets
+from startup import init_startup, mark, warm_up
 from models import *
 from university import university_bp
-
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'your-secret-key'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///university.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-db.init_app(app)
-
-# Register blueprints
-app.register_blueprint(university_bp, url_prefix='/university')
+from api import api_bp
 
 # Portfolio routes
-@app.route('/')
 def portfolio():
     return render_template('portfolio.html')
 
-@app.route('/project2')
 def project2():
     return render_template('project2.html')
 
+def _in_memory(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and (url.database in (None, '', ':memory:') or url.query.get('mode') == 'memory')
+
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key')
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///university.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if config:
+        app.config.update(config)
+    if not _in_memory(app.config['SQLALCHEMY_DATABASE_URI']):
+        # One pooled connection per request thread (GUNICORN_THREADS), plus headroom for background
+        # work; in-memory SQLite shares one connection (StaticPool), which takes no pool sizes
+        threads = int(os.environ.get('GUNICORN_THREADS', 4))
+        app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {'pool_size': threads, 'max_overflow': threads})
+    init_startup(app)
+
+    db.init_app(app)
+    configure_engine(app)
+    init_instrumentation(app)
+    init_assets(app)
+
+    # Register blueprints
+    app.register_blueprint(university_bp, url_prefix='/university')
+    app.register_blueprint(api_bp, url_prefix='/api')
+    app.add_url_rule('/', view_func=portfolio)
+    app.add_url_rule('/project2', view_func=project2)
+    mark('create_app')
+    return app
+
+def prepare_database(app):
+    # Creates missing tables and fails the jobs the previous run left queued or running,
+    # which will never finish
+    from job_workers import fail_orphaned_jobs
+    with app.app_context():
+        db.create_all()
+        with db.engine.begin() as connection:
+            fail_orphaned_jobs(connection)
+        db.engine.dispose()
+
 if __name__ == '__main__':
+    app = create_app()
     with app.app_context():
         db.create_all()
-    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)), debug=False)
\ No newline at end of file
+    if app.config['WARM_UP']:
+        warm_up(app)
+    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)), debug=False)
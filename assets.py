@@ -0,0 +1,175 @@
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import urllib.request
+from flask import current_app, request, send_file, url_for, abort
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional: without it only gzip variants are built
+    brotli = None
+
+# Logical names under static/ that templates load through asset_url()
+ASSETS = [
+    'css/site.css',
+    'js/typeahead.js',
+    'vendor/bootstrap-5.1.3/bootstrap.min.css',
+    'vendor/bootstrap-5.3.0/bootstrap.min.css',
+    'vendor/bootstrap-5.3.0/bootstrap.bundle.min.js',
+    'vendor/jquery-3.7.0/jquery.min.js',
+    'vendor/datatables-1.13.4/dataTables.bootstrap5.min.css',
+    'vendor/datatables-1.13.4/jquery.dataTables.min.js',
+    'vendor/datatables-1.13.4/dataTables.bootstrap5.min.js',
+]
+# Third-party files fetched once by the build and pinned by their SRI hash; until then
+# asset_url() points at the CDN they came from. A None hash is not pinned yet: the build
+# logs the hash of what it fetched, to be copied here
+VENDORED = {
+    'vendor/bootstrap-5.1.3/bootstrap.min.css':
+        ('https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css',
+         'sha384-1BmE4kWBq78iYhFldvKuhfTAU6auU8tT94WrHftjDbrCEXSU1oBoqyl2QvZ6jIW3'),
+    'vendor/bootstrap-5.3.0/bootstrap.min.css':
+        ('https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css',
+         'sha384-9ndCyUaIbzAi2FUVXJi0CjmCapSmO7SnpJef0486qhLnuZ2cdeRhO02iuK6FUUVM'),
+    'vendor/bootstrap-5.3.0/bootstrap.bundle.min.js':
+        ('https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js',
+         'sha384-geWF76RCwLtnZ8qwWowPQNguL3RmwHVBC9FhGdlKrxdiJJigb/j/68SIy3Te4Bkz'),
+    'vendor/jquery-3.7.0/jquery.min.js':
+        ('https://code.jquery.com/jquery-3.7.0.min.js', None),
+    'vendor/datatables-1.13.4/dataTables.bootstrap5.min.css':
+        ('https://cdn.datatables.net/1.13.4/css/dataTables.bootstrap5.min.css', None),
+    'vendor/datatables-1.13.4/jquery.dataTables.min.js':
+        ('https://cdn.datatables.net/1.13.4/js/jquery.dataTables.min.js', None),
+    'vendor/datatables-1.13.4/dataTables.bootstrap5.min.js':
+        ('https://cdn.datatables.net/1.13.4/js/dataTables.bootstrap5.min.js', None),
+}
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Served in this order of preference when the client accepts them
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+log = logging.getLogger('university.assets')
+
+
+def minify_css(source):
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r'\s*([{};,>])\s*', r'\1', source)
+    source = re.sub(r':\s+', ':', source)
+    return source.replace(';}', '}').strip()
+
+
+def minify_js(source):
+    # Conservative: indentation, blank lines and whole-line comments only
+    lines = (line.strip() for line in source.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//')) + '\n'
+
+
+def _integrity(data):
+    return 'sha384-' + base64.b64encode(hashlib.sha384(data).digest()).decode('ascii')
+
+
+def vendor(static_folder):
+    for name, (url, integrity) in VENDORED.items():
+        path = os.path.join(static_folder, name)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                data = f.read()
+            fetched = False
+        else:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                data = response.read()
+            fetched = True
+        if integrity is None:
+            log.warning("%s is not pinned; add %s to VENDORED", name, _integrity(data))
+        elif _integrity(data) != integrity:
+            raise ValueError(f"{name}: content does not match the pinned {integrity}")
+        if fetched:
+            _write(path, data)
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def build_assets(static_folder):
+    # Minifies each asset, writes it under static/dist with its content hash in the name,
+    # next to .gz and .br variants where they are smaller, and records logical -> built
+    # names in static/dist/manifest.json. Old builds are kept for pages still cached.
+    vendor(static_folder)
+    manifest = {}
+    for name in ASSETS:
+        with open(os.path.join(static_folder, name), 'rb') as f:
+            data = f.read()
+        base, ext = os.path.splitext(name)
+        if not base.endswith('.min'):
+            minify = minify_css if ext == '.css' else minify_js if ext == '.js' else None
+            if minify:
+                data = minify(data.decode('utf-8')).encode('utf-8')
+        built = f"{base}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+        path = os.path.join(static_folder, DIST, built)
+        _write(path, data)
+        variants = {'.gz': gzip.compress(data, 9, mtime=0)}
+        if brotli is not None:
+            variants['.br'] = brotli.compress(data, quality=11)
+        for suffix, compressed in variants.items():
+            if len(compressed) < len(data):
+                _write(path + suffix, compressed)
+        manifest[name] = built
+    _write(os.path.join(static_folder, DIST, MANIFEST), json.dumps(manifest, indent=2).encode('utf-8'))
+    return manifest
+
+
+def _load_manifest(static_folder):
+    try:
+        with open(os.path.join(static_folder, DIST, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def asset_url(name):
+    # Fingerprinted URL once build_assets.py has run; the plain static file (or, for a
+    # vendored file not fetched yet, its CDN) otherwise
+    built = current_app.extensions['asset_manifest'].get(name)
+    if built:
+        return url_for('assets', filename=built)
+    if name in VENDORED and not os.path.exists(os.path.join(current_app.static_folder, name)):
+        return VENDORED[name][0]
+    return url_for('static', filename=name)
+
+
+def serve_asset(filename):
+    # Built names change with their content, so responses are cacheable forever; the
+    # precompressed variant matching Accept-Encoding is sent as is
+    path = safe_join(os.path.join(current_app.static_folder, DIST), filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    encoding = None
+    for candidate, suffix in ENCODINGS:
+        if request.accept_encodings[candidate] and os.path.isfile(path + suffix):
+            encoding, path = candidate, path + suffix
+            break
+    response = send_file(path, mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+                         conditional=True, max_age=IMMUTABLE_MAX_AGE)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def init_assets(app):
+    app.extensions['asset_manifest'] = _load_manifest(app.static_folder)
+    app.add_template_global(asset_url)
+    app.add_url_rule('/assets/<path:filename>', 'assets', serve_asset)
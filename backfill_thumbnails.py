@@ -0,0 +1,13 @@
+import sys
+from app import create_app
+from gallery import backfill_thumbnails
+
+app = create_app()
+
+def backfill(force=False):
+    with app.app_context():
+        created = backfill_thumbnails(force=force)
+        print(f"Created thumbnails for {created} images")
+
+if __name__ == "__main__":
+    backfill(force='--force' in sys.argv)
@@ -0,0 +1,18 @@
+import sys
+import time
+from app import create_app
+from snapshot import iter_snapshot, snapshot_filename
+
+app = create_app()
+
+def backup(path):
+    # Same archive as /university/snapshot, written straight to disk
+    with app.app_context():
+        started = time.perf_counter()
+        with open(path, 'wb') as f:
+            for chunk in iter_snapshot():
+                f.write(chunk)
+        print(f"Snapshot written to {path} in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    backup(sys.argv[1] if len(sys.argv) > 1 else snapshot_filename())
@@ -0,0 +1,323 @@
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import re
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from app import create_app, db
+from models import Student
+from synthetic_data import SCALES, generate
+import analytics
+import choices
+from gallery import GALLERY_CATEGORIES, gallery_index
+from versions import html_cache
+
+# python bench.py run --scale 100k --output results.json [--baseline baseline.json]
+# python bench.py compare baseline.json results.json
+REPEAT = 20
+EXPORT_REPEAT = 3
+IMPORT_REPEAT = 3
+IMPORT_ROWS = 1000
+CONCURRENT_THREADS = 8
+CONCURRENT_REQUESTS = 25
+STARTUP_REPEAT = 5
+# A scenario regresses when p50/p95 grow by more than the threshold and by at least
+# MIN_DELTA_MS, when it issues more queries per request, or when peak RSS grows too much
+REGRESSION_THRESHOLD = 0.10
+RSS_THRESHOLD = 0.20
+MIN_DELTA_MS = 1.0
+
+def _statements(response):
+    # Counted by instrumentation.py; a streamed body's statements run after the header is set
+    return int(response.headers.get('X-SQL-Statements', 0))
+
+
+def percentile(values, p):
+    # Nearest-rank percentile
+    ordered = sorted(values)
+    return ordered[max(math.ceil(p / 100 * len(ordered)), 1) - 1]
+
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def summarize(timings, queries, sizes, errors=0):
+    return {
+        'requests': len(timings),
+        'errors': errors,
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p90_ms': round(percentile(timings, 90), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'max_ms': round(max(timings), 3),
+        'queries_per_request': round(sum(queries) / len(queries), 2),
+        'max_queries': max(queries),
+        'mean_bytes': round(sum(sizes) / len(sizes)),
+        'peak_rss_kb': peak_rss_kb(),
+    }
+
+
+def _cold():
+    # Rendered pages, analytics and form choices are memoised per table version and the
+    # gallery listing per directory state; scenarios measure the real work
+    html_cache.clear()
+    for report in (analytics.transcript, analytics.course_grades, analytics.professor_grades,
+                   analytics.department_averages):
+        report.cache_clear()
+    choices.invalidate(*choices.CHOICE_QUERIES)
+    for category in GALLERY_CATEGORIES:
+        gallery_index.invalidate(category)
+
+
+def _rejected_rows(response):
+    # Import pages answer 200 even when rows are rejected; the report states how many
+    match = re.search(rb'(\d+) rejected', response.get_data())
+    return int(match.group(1)) if match else 1
+
+
+def measure(send, repeat, cold=True, count_errors=None):
+    send(-1)  # warm-up: first-request setup, template compilation
+    timings, queries, sizes, errors = [], [], [], 0
+    for i in range(repeat):
+        if cold:
+            _cold()
+        started = time.perf_counter()
+        response = send(i)
+        body = response.get_data()
+        timings.append((time.perf_counter() - started) * 1000)
+        queries.append(_statements(response))
+        sizes.append(len(body))
+        errors += count_errors(response) if count_errors else response.status_code >= 400
+    return summarize(timings, queries, sizes, errors)
+
+
+def _csv(header, rows):
+    return (','.join(header) + '\n' + ''.join(','.join(str(v) for v in row) + '\n' for row in rows)).encode()
+
+
+def import_files(rows=IMPORT_ROWS):
+    # The first run inserts, the repeats upsert the same rows
+    base = 10_000_000
+    return {
+        'students': _csv(['ID', 'Name', 'Email', 'Major'],
+                         [('', f'Bench {i}', f'bench{i}@student.edu', 'Physics') for i in range(rows)]),
+        'professors': _csv(['ID', 'Name', 'Email', 'Department'],
+                           [('', f'Dr. Bench {i}', f'bench{i}@university.edu', 'Physics') for i in range(rows)]),
+        'courses': _csv(['ID', 'Name', 'Code', 'Credits', 'Professor ID'],
+                        [(base + i, f'Bench {i}', f'B{i:06d}', 3, 'i0001') for i in range(rows)]),
+        'enrollments': _csv(['ID', 'Student ID', 'Course ID', 'Grade'],
+                            [(base + i, f's{i + 1:04d}', 1 + i % 7, 'B') for i in range(rows)]),
+        'payments': _csv(['ID', 'Student ID', 'Course ID', 'Amount Paid', 'Payment Date', 'Status'],
+                         [(base + i, 's0001', 1, 60.0, '2024-09-01 10:00:00', 'paid') for i in range(rows)]),
+    }
+
+
+def scenarios(app, repeat):
+    client = app.test_client()
+    with app.app_context():
+        student_ids = [s for (s,) in db.session.execute(db.select(Student.id).order_by(Student.id).limit(100))]
+
+    def get(url):
+        return lambda i: client.get(url)
+
+    pages = {
+        'list students': '/university/students',
+        'list professors': '/university/professors',
+        'list courses': '/university/courses',
+        'list enrollments': '/university/enrollments',
+        'list payments': '/university/payments',
+        'list payments by date': '/university/payments?sort=-date',
+        'list overdue payments': '/university/payments?status=overdue',
+        'reports dashboard': '/university/reports',
+        'department grades': '/university/reports/departments',
+        'search': '/university/search?q=ali',
+        'api payments with includes': '/api/payments?include=student,course',
+        'api bulk students': '/api/students?ids=' + ','.join(student_ids),
+        'gallery': '/university/gallery',
+    }
+    for name, url in pages.items():
+        yield name, lambda url=url: measure(get(url), repeat)
+    yield 'list students (cached)', lambda: measure(get('/university/students'), repeat, cold=False)
+
+    forms = {
+        'form add student': '/university/students/add',
+        'form add course': '/university/courses/add',
+        'form add enrollment': '/university/enrollments/add',
+        'form add payment': '/university/payments/add',
+        'form edit student': f'/university/students/edit/{student_ids[0]}',
+        'form edit payment': '/university/payments/edit/1',
+    }
+    for name, url in forms.items():
+        yield name, lambda url=url: measure(get(url), repeat)
+
+    for table in ('students', 'professors', 'courses', 'enrollments', 'payments'):
+        yield f'export {table}', lambda table=table: measure(get(f'/university/{table}/export'), EXPORT_REPEAT)
+    yield 'export payments (gzip)', lambda: measure(get('/university/payments/export?gzip=1'), EXPORT_REPEAT)
+    yield 'api enrollments ndjson', lambda: measure(get('/api/enrollments?format=ndjson'), EXPORT_REPEAT)
+
+    for table, data in import_files().items():
+        def send(i, table=table, data=data):
+            return client.post(f'/university/{table}/import', content_type='multipart/form-data',
+                               data={'file': (io.BytesIO(data), f'{table}.csv'), 'mode': 'upsert'})
+        yield (f'import {table} ({IMPORT_ROWS} rows)',
+               lambda send=send: measure(send, IMPORT_REPEAT, cold=False, count_errors=_rejected_rows))
+
+    yield 'concurrent add student', lambda: concurrent_inserts(app)
+
+
+def concurrent_inserts(app, threads=CONCURRENT_THREADS, per_thread=CONCURRENT_REQUESTS):
+    # Student IDs come from IdAllocator; every insert must get a distinct one
+    def worker(n):
+        client = app.test_client()
+        results = []
+        for i in range(per_thread):
+            started = time.perf_counter()
+            response = client.post('/university/students/add',
+                                   data={'name': f'Concurrent {n}-{i}', 'email': f'concurrent{n}-{i}@student.edu',
+                                         'major': 'Physics'})
+            results.append(((time.perf_counter() - started) * 1000, _statements(response),
+                            len(response.get_data()), response.status_code >= 400))
+        return results
+
+    with ThreadPoolExecutor(threads) as pool:
+        results = [r for batch in pool.map(worker, range(threads)) for r in batch]
+    summary = summarize([r[0] for r in results], [r[1] for r in results], [r[2] for r in results],
+                        sum(r[3] for r in results))
+    with app.app_context():
+        created = db.session.execute(db.select(db.func.count(Student.id), db.func.count(db.distinct(Student.id)))
+                                     .where(Student.email.like('concurrent%'))).one()
+    summary['threads'] = threads
+    summary['duplicate_ids'] = created[0] - created[1]
+    summary['errors'] += threads * per_thread - created[0]
+    return summary
+
+
+def cold_start(database, repeat=STARTUP_REPEAT, path='/university/students'):
+    # Median per phase over fresh interpreters, each timed by startup_report.py
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{os.path.abspath(database)}')
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'startup_report.py')
+    runs = [json.loads(subprocess.run([sys.executable, script, '--json', '--path', path], env=env, check=True,
+                                      capture_output=True, text=True).stdout) for _ in range(repeat)]
+    return {f'{phase}_ms': round(percentile([run[phase] * 1000 for run in runs], 50), 3) for phase in runs[0]}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    database = args.database or os.path.join(tempfile.mkdtemp(prefix='bench-'), 'bench.db')
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.abspath(database)}',
+                      'WTF_CSRF_ENABLED': False, 'SQL_QUERY_BUDGET': False})
+    with app.app_context():
+        generated = None
+        if not args.database or not os.path.exists(database):
+            db.create_all()
+            started = time.perf_counter()
+            with db.engine.begin() as connection:
+                generated = generate(connection, args.scale, args.seed)
+            print(f"Generated {generated} in {time.perf_counter() - started:.1f}s")
+        else:
+            print(f"Reusing {database}")
+
+    results = {
+        'meta': {'scale': args.scale, 'seed': args.seed, 'repeat': args.repeat, 'rows': generated,
+                 'commit': _git_commit(), 'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+                 'platform': platform.platform(), 'started_at': datetime.now(timezone.utc).isoformat()},
+        'scenarios': {},
+    }
+    for name, scenario in scenarios(app, args.repeat):
+        if args.only and args.only not in name:
+            continue
+        summary = results['scenarios'][name] = scenario()
+        print(f"{name:40} p50 {summary['p50_ms']:9.2f}ms  p95 {summary['p95_ms']:9.2f}ms  "
+              f"{summary['queries_per_request']:6.1f} q/req  rss {summary['peak_rss_kb'] // 1024}MB"
+              + (f"  {summary['errors']} errors" if summary['errors'] else ''))
+
+    if not args.only or args.only in 'startup':
+        startup = results['startup'] = cold_start(database)
+        print(f"{'startup':40} " + '  '.join(f"{key[:-3]} {value:.0f}ms" for key, value in startup.items()))
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            return compare(json.load(f), results, args.threshold)
+    return True
+
+
+def compare(baseline, current, threshold=REGRESSION_THRESHOLD):
+    regressions = []
+    for name, now in current['scenarios'].items():
+        before = baseline['scenarios'].get(name)
+        if before is None:
+            print(f"new  {name}")
+            continue
+        problems = []
+        for key in ('p50_ms', 'p95_ms'):
+            delta = now[key] - before[key]
+            if delta > MIN_DELTA_MS and delta > before[key] * threshold:
+                problems.append(f"{key} {before[key]:.2f} -> {now[key]:.2f}")
+        if now['queries_per_request'] > before['queries_per_request']:
+            problems.append(f"queries/request {before['queries_per_request']} -> {now['queries_per_request']}")
+        if now['peak_rss_kb'] > before['peak_rss_kb'] * (1 + RSS_THRESHOLD):
+            problems.append(f"peak RSS {before['peak_rss_kb'] // 1024}MB -> {now['peak_rss_kb'] // 1024}MB")
+        if now.get('errors', 0) > before.get('errors', 0) or now.get('duplicate_ids', 0):
+            problems.append(f"errors {before.get('errors', 0)} -> {now.get('errors', 0)}")
+        if problems:
+            regressions.append(name)
+        print(f"{'FAIL' if problems else 'ok  '} {name}: {'; '.join(problems) or 'p50 %.2f -> %.2f' % (before['p50_ms'], now['p50_ms'])}")
+    before, now = baseline.get('startup', {}).get('first_response_ms'), current.get('startup', {}).get('first_response_ms')
+    if before is not None and now is not None:
+        slower = now - before > MIN_DELTA_MS and now - before > before * threshold
+        if slower:
+            regressions.append('startup')
+        print(f"{'FAIL' if slower else 'ok  '} startup: first response {before:.0f}ms -> {now:.0f}ms")
+    if baseline['meta'].get('scale') != current['meta'].get('scale'):
+        print(f"warning: comparing scale {baseline['meta'].get('scale')} against {current['meta'].get('scale')}")
+    print(f"{len(regressions)} regression(s)")
+    return not regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Benchmark the university app against synthetic data')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run')
+    run_parser.add_argument('--scale', choices=sorted(SCALES), default='10k')
+    run_parser.add_argument('--seed', type=int, default=1)
+    run_parser.add_argument('--repeat', type=int, default=REPEAT)
+    run_parser.add_argument('--database', help='SQLite file to generate into, or reuse when it exists')
+    run_parser.add_argument('--output', default='bench_results.json')
+    run_parser.add_argument('--only', help='Only run scenarios whose name contains this text')
+    run_parser.add_argument('--baseline', help='Compare against a saved results file')
+    run_parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    compare_parser = commands.add_parser('compare')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    if args.command == 'compare':
+        with open(args.baseline) as f, open(args.current) as g:
+            return compare(json.load(f), json.load(g), args.threshold)
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main(sys.argv[1:]) else 1)
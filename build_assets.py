@@ -0,0 +1,13 @@
+from app import create_app
+from assets import build_assets
+
+app = create_app()
+
+def build():
+    # Run on deploy (render.yaml); the app picks up static/dist/manifest.json when it starts
+    manifest = build_assets(app.static_folder)
+    for name, built in manifest.items():
+        print(f"{name} -> {built}")
+
+if __name__ == "__main__":
+    build()
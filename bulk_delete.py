@@ -0,0 +1,65 @@
+from sqlalchemy import delete, func, select
+from database import db
+from models import Student, Professor, Course
+
+MAX_BULK_IDS = 10000
+
+# name -> (model, {filter argument: column})
+BULK_DELETES = {
+    'students': (Student, {'major': Student.major}),
+    'professors': (Professor, {'department': Professor.department}),
+    'courses': (Course, {'professor': Course.professor_id}),
+}
+
+
+class DeleteRestricted(Exception):
+    def __init__(self, table, referenced, count):
+        super().__init__(f"{count} {table} rows still reference the {referenced} rows being deleted")
+        self.table = table
+        self.count = count
+
+
+def _referencing(table):
+    # Foreign keys pointing at `table`, with the ON DELETE rule each declares in models.py
+    for child in db.metadata.sorted_tables:
+        for fk in child.foreign_keys:
+            if fk.column.table is table:
+                yield child, fk, (fk.ondelete or 'NO ACTION').upper()
+
+
+def cascade_delete(table, where, counts):
+    # Cascading children are deleted first with one set-based DELETE each, which is what
+    # ON DELETE CASCADE would do, but leaves a row count per table to report
+    for child, fk, rule in _referencing(table):
+        selected = select(fk.column).where(where).scalar_subquery()
+        if rule == 'CASCADE':
+            cascade_delete(child, fk.parent.in_(selected), counts)
+        else:
+            count = db.session.scalar(select(func.count()).select_from(child).where(fk.parent.in_(selected)))
+            if count:
+                raise DeleteRestricted(child.name, table.name, count)
+    outcome = db.session.execute(delete(table).where(where))
+    counts[table.name] = counts.get(table.name, 0) + outcome.rowcount
+
+
+def bulk_delete(name, ids=None, filters=None, dry_run=False):
+    # Deletes the rows matching `ids` and/or `filters` together with everything that cascades
+    # from them, in one transaction; returns {table: rows deleted}. A dry run rolls back.
+    model, columns = BULK_DELETES[name]
+    table = model.__table__
+    conditions = [columns[arg] == value for arg, value in (filters or {}).items()]
+    if ids:
+        conditions.append(model.__mapper__.primary_key[0].in_(ids))
+    if not conditions:
+        raise ValueError("an id list or a filter is required")
+    counts = {}
+    try:
+        cascade_delete(table, db.and_(*conditions), counts)
+    except Exception:
+        db.session.rollback()
+        raise
+    if dry_run:
+        db.session.rollback()
+    else:
+        db.session.commit()
+    return counts
@@ -0,0 +1,116 @@
+import bisect
+import re
+import threading
+from flask import url_for
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from database import db
+from models import Student, Professor, Course
+from versions import get_versions
+
+# Above this many options a select only renders the current value and is filled by typeahead
+TYPEAHEAD_THRESHOLD = 500
+
+CHOICE_QUERIES = {
+    'students': lambda: db.select(Student.id, Student.name),
+    'professors': lambda: db.select(Professor.id, Professor.name),
+    'courses': lambda: db.select(Course.id, Course.name + ' (' + Course.code + ')'),
+}
+TABLE_KINDS = {'student': 'students', 'professor': 'professors', 'course': 'courses'}
+KIND_TABLES = {kind: table for table, kind in TABLE_KINDS.items()}
+
+
+# Where a typeahead query may start matching a label: its start and every word after it,
+# so "cs" finds "Intro (CS101)" and a surname finds the student
+WORD_START = re.compile(r'\b\w')
+
+
+class ChoiceList:
+    def __init__(self, rows, version):
+        self.choices = sorted(rows, key=lambda row: (row[1].lower(), row[0]))
+        # One (term, position in choices) per id and per word start of the label, sorted for bisect
+        terms = []
+        for position, (value, label) in enumerate(self.choices):
+            label = label.lower()
+            terms.append((str(value).lower(), position))
+            terms.extend((label[match.start():], position) for match in WORD_START.finditer(label))
+        terms.sort()
+        self.keys = [term for term, _ in terms]
+        self.positions = [position for _, position in terms]
+        self.version = version
+
+    def search(self, prefix, limit):
+        prefix = prefix.lower()
+        found = set()
+        for i in range(bisect.bisect_left(self.keys, prefix), len(self.keys)):
+            if len(found) >= limit or not self.keys[i].startswith(prefix):
+                break
+            found.add(self.positions[i])
+        return [self.choices[position] for position in sorted(found)]
+
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def get_choice_list(kind):
+    # Reloaded whenever the source table's version moves, which also catches writes made
+    # by other worker processes; the hooks below cover this process's uncommitted changes
+    table = KIND_TABLES[kind]
+    version = get_versions([table])[table]
+    entry = _cache.get(kind)
+    if entry is None or entry.version != version:
+        entry = ChoiceList([tuple(row) for row in db.session.execute(CHOICE_QUERIES[kind]())], version)
+        with _lock:
+            _cache[kind] = entry
+    return entry
+
+
+def get_choices(kind):
+    return get_choice_list(kind).choices
+
+
+def invalidate(*kinds):
+    with _lock:
+        for kind in kinds:
+            _cache.pop(kind, None)
+
+
+def limit_choices(field, kind):
+    # Called after validation: keep the full list for validating, render only the selection
+    if len(field.choices) > TYPEAHEAD_THRESHOLD:
+        field.choices = [choice for choice in field.choices if choice[0] == field.data]
+        field.render_kw = {'data-typeahead': url_for('university.typeahead', kind=kind)}
+
+
+def _mark_changed(session, tables):
+    kinds = {TABLE_KINDS[t] for t in tables if t in TABLE_KINDS}
+    if kinds:
+        invalidate(*kinds)
+        session.info.setdefault('changed_choice_kinds', set()).update(kinds)
+
+
+@event.listens_for(Session, 'after_flush')
+def _after_flush(session, flush_context):
+    changed = list(session.new) + list(session.dirty) + list(session.deleted)
+    _mark_changed(session, {obj.__table__.name for obj in changed if hasattr(obj, '__table__')})
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _after_bulk_statement(orm_execute_state):
+    # Core insert/update/delete run through the session (bulk imports, bulk deletes)
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if table is not None:
+            _mark_changed(orm_execute_state.session, {table.name})
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    # Drop again once committed, in case another request re-filled the cache from pre-commit data
+    invalidate(*session.info.pop('changed_choice_kinds', ()))
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _after_rollback(session, previous_transaction):
+    invalidate(*session.info.pop('changed_choice_kinds', ()))
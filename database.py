@@ -1,3 +1,30 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 
-db = SQLAlchemy()
\ No newline at end of file
+db = SQLAlchemy()
+
+# Applied to every new SQLite connection: WAL lets readers run alongside a writer,
+# busy_timeout makes writers queue instead of failing with "database is locked",
+# foreign_keys enforces the ON DELETE CASCADE/RESTRICT rules declared in models.py.
+SQLITE_PRAGMAS = {
+    'foreign_keys': 'ON',
+    'journal_mode': 'WAL',
+    'busy_timeout': 10000,
+    'synchronous': 'NORMAL',
+    'cache_size': -32000,
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY',
+}
+
+def configure_engine(app):
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
@@ -0,0 +1,62 @@
+import csv
+import io
+import zlib
+from flask import Response, stream_with_context
+from database import db
+from models import Student, Professor, Course, Enrollment, TuitionPayment
+
+CHUNK_SIZE = 1000
+
+# CSV header and the columns selected for each exportable table
+EXPORT_COLUMNS = {
+    'students': (['ID', 'Name', 'Email', 'Major'],
+                 [Student.id, Student.name, Student.email, Student.major]),
+    'professors': (['ID', 'Name', 'Email', 'Department'],
+                   [Professor.id, Professor.name, Professor.email, Professor.department]),
+    'courses': (['ID', 'Name', 'Code', 'Credits', 'Professor ID'],
+                [Course.id, Course.name, Course.code, Course.credits, Course.professor_id]),
+    'enrollments': (['ID', 'Student ID', 'Course ID', 'Grade'],
+                    [Enrollment.id, Enrollment.student_id, Enrollment.course_id, Enrollment.grade]),
+    'payments': (['ID', 'Student ID', 'Course ID', 'Amount Paid', 'Payment Date', 'Status'],
+                 [TuitionPayment.id, TuitionPayment.student_id, TuitionPayment.course_id,
+                  TuitionPayment.amount_paid, TuitionPayment.payment_date, TuitionPayment.status]),
+}
+
+
+def iter_csv(header, columns, chunk_size=CHUNK_SIZE, progress=None):
+    # Plain column tuples fetched chunk_size rows at a time, never full ORM entities,
+    # so memory stays flat however large the table is. `progress(n)` gets each chunk's row count.
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    result = db.session.execute(
+        db.select(*columns).order_by(columns[0]).execution_options(yield_per=chunk_size)
+    )
+    for rows in result.partitions():
+        writer.writerows(rows)
+        if progress:
+            progress(len(rows))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def csv_response(name, gzip=False):
+    header, columns = EXPORT_COLUMNS[name]
+    chunks = stream_with_context(iter_csv(header, columns))
+    if gzip:
+        return Response(gzip_chunks(chunks), mimetype='application/gzip',
+                        headers={'Content-Disposition': f'attachment; filename={name}.csv.gz'})
+    return Response(chunks, mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename={name}.csv'})
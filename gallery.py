@@ -0,0 +1,261 @@
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+import threading
+from flask import current_app, send_file
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+from werkzeug.formparser import parse_form_data
+from werkzeug.utils import secure_filename
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional: without it the gallery serves the originals
+    Image = None
+
+GALLERY_CATEGORIES = ['campus', 'academic', 'student']
+UPLOAD_ROOT = os.path.join('static', 'uploads')
+THUMB_ROOT = os.path.join('static', 'thumbs')
+THUMB_SIZE = (400, 300)
+# Upload contents stored once under their SHA-256; each category entry is a hard link to its blob
+BLOB_ROOT = os.path.join(UPLOAD_ROOT, 'blobs')
+BLOB_NAME = re.compile(r'[0-9a-f]{64}')
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+# Multipart boundaries and headers on top of the file itself
+FORM_OVERHEAD = 64 * 1024
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def upload_dir(category):
+    return os.path.join(UPLOAD_ROOT, category)
+
+
+def blob_path(digest):
+    return os.path.join(BLOB_ROOT, digest[:2], digest)
+
+
+def _link(source, path):
+    # Atomically points `path` at the same file as `source`; copies where hard links are unsupported
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{os.getpid()}.{threading.get_ident()}")
+    try:
+        os.link(source, tmp)
+    except OSError:
+        shutil.copyfile(source, tmp)
+    os.replace(tmp, path)
+
+
+class HashingWriter:
+    # What Werkzeug's multipart parser writes a file part into: the bytes go straight to a
+    # temporary file beside the blobs, hashed on the way, and are refused past max_size
+
+    def __init__(self, max_size):
+        os.makedirs(BLOB_ROOT, exist_ok=True)
+        self.file = tempfile.NamedTemporaryFile(dir=BLOB_ROOT, prefix='.upload-', delete=False)
+        self.max_size = max_size
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise RequestEntityTooLarge()
+        self.sha256.update(data)
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+def store_upload(category, environ):
+    # Streams the request's `file` part to disk and stores it under its content hash; an
+    # identical image already stored is reused. Returns the stored name, or None if no file.
+    max_size = current_app.config.get('GALLERY_MAX_UPLOAD_BYTES', MAX_UPLOAD_BYTES)
+    writers = []
+
+    def stream_factory(total_content_length, content_type, filename, content_length=None):
+        writers.append(HashingWriter(max_size))
+        return writers[-1]
+
+    try:
+        _, _, files = parse_form_data(environ, stream_factory=stream_factory,
+                                      max_content_length=max_size + FORM_OVERHEAD)
+        upload = files.get('file')
+        if upload is None or not upload.filename:
+            return None
+        filename = secure_filename(upload.filename)
+        if os.path.splitext(filename)[1].lower() not in IMAGE_EXTENSIONS:
+            raise BadRequest(f"Only {', '.join(sorted(IMAGE_EXTENSIONS))} images can be uploaded")
+        writer = upload.stream
+        writer.file.close()
+        blob = blob_path(writer.sha256.hexdigest())
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            os.replace(writer.file.name, blob)
+        _link(blob, os.path.join(upload_dir(category), filename))
+        return filename
+    finally:
+        for writer in writers:
+            writer.file.close()
+            if os.path.exists(writer.file.name):
+                os.remove(writer.file.name)
+
+
+def send_blob(digest, download_name):
+    # The URL names the content, so it may be cached forever. send_file answers Range and
+    # conditional requests and hands the file to the server's wsgi.file_wrapper (sendfile
+    # under gunicorn), or to the front end with USE_X_SENDFILE.
+    response = send_file(os.path.abspath(blob_path(digest)), as_attachment=True, download_name=download_name,
+                         mimetype=mimetypes.guess_type(download_name)[0] or 'application/octet-stream',
+                         conditional=True, etag=digest, max_age=IMMUTABLE_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def thumb_paths(category, filename):
+    base = os.path.join(THUMB_ROOT, category, filename)
+    return base + '.jpg', base + '.webp'
+
+
+def _dir_state(category):
+    # Uploads and derivatives both change the listing (a backfill may run in another process)
+    state = []
+    for directory in (upload_dir(category), os.path.join(THUMB_ROOT, category)):
+        try:
+            state.append(os.stat(directory).st_mtime_ns)
+        except OSError:
+            state.append(None)
+    return state
+
+
+def make_thumbnails(category, filename, force=False):
+    # Resized JPEG and WebP derivatives of an upload, generated once
+    if Image is None:
+        return False
+    jpeg_path, webp_path = thumb_paths(category, filename)
+    if not force and (os.path.exists(jpeg_path) or os.path.exists(webp_path)):
+        return False
+    os.makedirs(os.path.dirname(jpeg_path), exist_ok=True)
+    original = os.path.join(upload_dir(category), filename)
+    try:
+        with Image.open(original) as image:
+            image.thumbnail(THUMB_SIZE)
+            image = image.convert('RGB')
+            image.save(jpeg_path, 'JPEG', quality=75, optimize=True, progressive=True)
+            image.save(webp_path, 'WEBP', quality=70)
+    except OSError:
+        current_app.logger.warning("could not create thumbnails for %s/%s", category, filename)
+        return False
+    # Small originals can re-encode larger; the gallery then falls back to the original
+    for path in (jpeg_path, webp_path):
+        if os.path.getsize(path) >= os.path.getsize(original):
+            os.remove(path)
+    return True
+
+
+def _describe(category, filename, stat):
+    path = os.path.join(upload_dir(category), filename)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    width = height = None
+    if Image is not None:
+        try:
+            with Image.open(path) as image:
+                width, height = image.size
+        except OSError:
+            pass
+    return {'name': filename, 'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+            'width': width, 'height': height, 'sha256': digest.hexdigest()}
+
+
+class GalleryIndex:
+    # Per-category listing with image metadata. A category is rescanned only when its
+    # directory mtimes change (or an upload invalidates it); files whose size and mtime
+    # are unchanged keep their metadata, which is also persisted across restarts.
+
+    def __init__(self):
+        self._categories = {}
+        self._lock = threading.Lock()
+
+    def _manifest_path(self):
+        return os.path.join(current_app.instance_path, 'gallery_index.json')
+
+    def _load_manifest(self):
+        try:
+            with open(self._manifest_path()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self):
+        os.makedirs(current_app.instance_path, exist_ok=True)
+        tmp = self._manifest_path() + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self._categories, f)
+        os.replace(tmp, self._manifest_path())
+
+    def invalidate(self, category):
+        with self._lock:
+            if category in self._categories:
+                self._categories[category]['dir_state'] = None
+
+    def images(self, category):
+        directory = upload_dir(category)
+        dir_state = _dir_state(category)
+        if dir_state[0] is None:
+            return []
+        with self._lock:
+            if not self._categories:
+                self._categories = self._load_manifest()
+            cached = self._categories.get(category)
+            if cached and cached.get('dir_state') == dir_state:
+                return cached['images']
+            known = {image['name']: image for image in (cached or {}).get('images', [])}
+            images = []
+            for entry in sorted(os.scandir(directory), key=lambda e: e.name):
+                if entry.name.startswith('.') or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                image = known.get(entry.name)
+                if not image or image['size'] != stat.st_size or image['mtime'] != stat.st_mtime_ns:
+                    image = _describe(category, entry.name, stat)
+                jpeg_path, webp_path = thumb_paths(category, entry.name)
+                # Paths relative to the static folder, for url_for('static', ...)
+                image['thumb'] = f"thumbs/{category}/{entry.name}.jpg" if os.path.exists(jpeg_path) else None
+                image['thumb_webp'] = f"thumbs/{category}/{entry.name}.webp" if os.path.exists(webp_path) else None
+                images.append(image)
+            self._categories[category] = {'dir_state': dir_state, 'images': images}
+            self._save_manifest()
+            return images
+
+    def lookup(self, category, name):
+        # The name-to-hash index: metadata, sha256 included, of the image stored under `name`
+        for image in self.images(category):
+            if image['name'] == name:
+                if not os.path.exists(blob_path(image['sha256'])):
+                    # Files that predate the blob store join it on first use
+                    _link(os.path.join(upload_dir(category), name), blob_path(image['sha256']))
+                return image
+        return None
+
+
+gallery_index = GalleryIndex()
+
+
+def backfill_thumbnails(force=False):
+    created = 0
+    for category in GALLERY_CATEGORIES:
+        if not os.path.isdir(upload_dir(category)):
+            continue
+        for filename in sorted(os.listdir(upload_dir(category))):
+            if not filename.startswith('.'):
+                created += make_thumbnails(category, filename, force=force)
+        gallery_index.invalidate(category)
+    return created
@@ -0,0 +1,46 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+
+# All settings can be overridden from the environment (Render, Procfile, ...)
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread' if threads > 1 else 'sync'
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+keepalive = 5
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+accesslog = '-'
+
+
+def on_starting(server):
+    # Create missing tables once, before any worker starts. Without preload the master must
+    # never build the app (workers load it themselves, and again on HUP), so a short-lived
+    # process does the work instead
+    if server.cfg.preload_app:
+        from wsgi import app
+        from app import prepare_database
+        prepare_database(app)
+    else:
+        subprocess.run([sys.executable, '-c', 'from app import create_app, prepare_database; '
+                        'prepare_database(create_app())'], cwd=server.cfg.chdir, check=True)
+
+
+def post_fork(server, worker):
+    # Never share SQLite connections inherited from a preloaded master
+    from wsgi import app
+    from database import db
+    from startup import restart, warm_up
+    from job_workers import fail_orphaned_jobs
+    restart()
+    with app.app_context():
+        db.engine.dispose(close=False)
+        # Picks up the jobs of a worker this one replaces
+        with db.engine.begin() as connection:
+            fail_orphaned_jobs(connection)
+    # Templates compiled and pool filled before this worker accepts its first request
+    if app.config['WARM_UP']:
+        warm_up(app)
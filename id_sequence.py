@@ -0,0 +1,118 @@
+import threading
+from collections import deque
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+BLOCK_SIZE = 50
+
+
+class IdAllocator:
+    # Hands out prefixed IDs ("s0001", "i0042", ... "s10000") from blocks reserved in the
+    # id_sequence table, so inserts don't need a MAX(id) lookup each. Reserving a block is
+    # an UPDATE, which SQLite serialises behind its write lock, so concurrent workers can
+    # never be given the same range. A block reserved inside a transaction is only
+    # shared with the rest of the process once that transaction commits.
+
+    def __init__(self, name, prefix, table, width=4, block_size=BLOCK_SIZE):
+        self.name = name
+        self.prefix = prefix
+        self.table = table
+        self.width = width
+        self.block_size = block_size
+        self._blocks = deque()
+        self._lock = threading.Lock()
+        _allocators[name] = self
+
+    def format(self, number):
+        return f"{self.prefix}{number:0{self.width}d}"
+
+    def next_id(self, connection):
+        return self.allocate(connection, 1)[0]
+
+    def allocate(self, connection, count):
+        numbers = []
+        with self._lock:
+            self._take(self._blocks, numbers, count)
+        pending = connection.info.setdefault('pending_id_blocks', {}).setdefault(self.name, deque())
+        self._take(pending, numbers, count)
+        if len(numbers) < count:
+            start, end = self._reserve(connection, max(self.block_size, count - len(numbers)))
+            pending.append([start, end])
+            self._take(pending, numbers, count)
+        return [self.format(n) for n in numbers]
+
+    def advance_past(self, connection, ids):
+        # Explicit IDs (e.g. from a CSV import) must never be handed out again later
+        numbers = [int(i[len(self.prefix):]) for i in ids
+                   if i.startswith(self.prefix) and i[len(self.prefix):].isdigit()]
+        if not numbers:
+            return
+        floor = max(numbers) + 1
+        self._update(connection, "next_value = MAX(next_value, :floor)", floor=floor)
+        pending = connection.info.get('pending_id_blocks', {}).get(self.name, deque())
+        with self._lock:
+            self._blocks = self._trim(self._blocks, floor)
+        pending_trimmed = self._trim(pending, floor)
+        pending.clear()
+        pending.extend(pending_trimmed)
+
+    def advance_past_existing(self, connection, floor=0):
+        # After rows were replaced wholesale (snapshot restore): next_value moves past every
+        # existing ID and never below `floor`
+        self._update(connection,
+                     f"next_value = MAX(next_value, :floor, (SELECT COALESCE(MAX(CAST(SUBSTR(id, :skip) AS INTEGER)), 0) + 1 "
+                     f"FROM {self.table} WHERE id LIKE :pattern))",
+                     floor=floor, skip=len(self.prefix) + 1, pattern=f"{self.prefix}%")
+
+    @staticmethod
+    def _trim(blocks, floor):
+        return deque([max(start, floor), end] for start, end in blocks if end > floor)
+
+    @staticmethod
+    def _take(blocks, numbers, count):
+        while blocks and len(numbers) < count:
+            block = blocks[0]
+            taken = min(block[1] - block[0], count - len(numbers))
+            numbers.extend(range(block[0], block[0] + taken))
+            block[0] += taken
+            if block[0] >= block[1]:
+                blocks.popleft()
+
+    def _update(self, connection, assignment, **params):
+        statement = text(f"UPDATE id_sequence SET {assignment} WHERE name = :name")
+        if connection.execute(statement, {'name': self.name, **params}).rowcount == 0:
+            # First use: start the sequence after the highest existing ID
+            self._seed(connection)
+            connection.execute(statement, {'name': self.name, **params})
+
+    def _seed(self, connection):
+        connection.execute(
+            text(f"INSERT OR IGNORE INTO id_sequence (name, next_value) "
+                 f"SELECT :name, COALESCE(MAX(CAST(SUBSTR(id, :skip) AS INTEGER)), 0) + 1 "
+                 f"FROM {self.table} WHERE id LIKE :pattern"),
+            {'name': self.name, 'skip': len(self.prefix) + 1, 'pattern': f"{self.prefix}%"},
+        )
+
+    def _reserve(self, connection, count):
+        self._update(connection, "next_value = next_value + :count", count=count)
+        end = connection.execute(
+            text("SELECT next_value FROM id_sequence WHERE name = :name"), {'name': self.name}
+        ).scalar()
+        return end - count, end
+
+
+_allocators = {}
+
+
+@event.listens_for(Engine, 'commit')
+def _publish_pending_blocks(conn):
+    pending = conn.info.pop('pending_id_blocks', None)
+    for name, blocks in (pending or {}).items():
+        allocator = _allocators[name]
+        with allocator._lock:
+            allocator._blocks.extend(blocks)
+
+
+@event.listens_for(Engine, 'rollback')
+def _discard_pending_blocks(conn):
+    conn.info.pop('pending_id_blocks', None)
@@ -0,0 +1,9 @@
+# Kept apart from importer.py so forms can list the modes without loading the importer
+IMPORT_MODES = [
+    ('insert', 'Insert new rows'),
+    ('upsert', 'Insert or update existing rows'),
+    ('skip', 'Insert new rows, skip existing'),
+    ('sync', 'Sync: write only new and changed rows'),
+    ('sync_delete', 'Sync, and delete rows missing from the file'),
+]
+SYNC_MODES = ('sync', 'sync_delete')
@@ -0,0 +1,310 @@
+import csv
+import hashlib
+import io
+import time
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import tuple_
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import DBAPIError
+from database import db
+from models import Student, Professor, Course, Enrollment, TuitionPayment, RowHash, student_ids, professor_ids
+from import_modes import SYNC_MODES
+from row_hashes import SYNC_KEYS, KEY_SEPARATOR
+from bulk_delete import DeleteRestricted, cascade_delete
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 500
+
+
+def _required(value, field):
+    value = value.strip()
+    if not value:
+        raise ValueError(f"{field} is required")
+    return value
+
+
+def parse_student(row):
+    return {'id': row[0].strip() or None, 'name': _required(row[1], 'Name'),
+            'email': _required(row[2], 'Email'), 'major': _required(row[3], 'Major')}
+
+
+def parse_professor(row):
+    return {'id': row[0].strip() or None, 'name': _required(row[1], 'Name'),
+            'email': _required(row[2], 'Email'), 'department': _required(row[3], 'Department')}
+
+
+def parse_course(row):
+    return {'id': int(row[0]), 'name': _required(row[1], 'Name'), 'code': _required(row[2], 'Code'),
+            'credits': int(row[3]), 'professor_id': _required(row[4], 'Professor ID')}
+
+
+def parse_enrollment(row):
+    return {'id': int(row[0]), 'student_id': _required(row[1], 'Student ID'),
+            'course_id': int(row[2]), 'grade': row[3].strip() or None}
+
+
+def parse_payment(row):
+    return {'id': int(row[0]), 'student_id': _required(row[1], 'Student ID'), 'course_id': int(row[2]),
+            'amount_paid': float(row[3]),
+            'payment_date': datetime.fromisoformat(row[4]) if row[4] else datetime.now(),
+            'status': _required(row[5], 'Status')}
+
+
+class ImportSpec:
+    def __init__(self, model, columns, parse, natural_key, ids=None, sync_required=()):
+        self.model = model
+        self.columns = columns
+        self.parse = parse
+        # Columns identifying an existing row for upsert/skip
+        self.natural_key = natural_key
+        # IdAllocator filling in blank IDs
+        self.ids = ids
+        # (index, field) of columns whose blank default would differ on every run, which a
+        # sync would see as a change each time
+        self.sync_required = sync_required
+        self.table = model.__table__
+        # What an upsert matches on or writes; generated primary keys are left out
+        self.hashed_columns = [c.name for c in self.table.columns if c.name in natural_key or not c.primary_key]
+
+    def key(self, values):
+        return KEY_SEPARATOR.join(str(values[c]) for c in self.natural_key)
+
+    def digest(self, values):
+        content = repr(tuple(values[c] for c in self.hashed_columns))
+        return hashlib.blake2b(content.encode('utf-8'), digest_size=16).hexdigest()
+
+    def key_filter(self, keys):
+        # keys: natural key value tuples
+        columns = [self.table.c[c] for c in self.natural_key]
+        if len(columns) == 1:
+            return columns[0].in_([key[0] for key in keys])
+        return tuple_(*columns).in_(keys)
+
+
+IMPORT_SPECS = {
+    'students': ImportSpec(Student, 4, parse_student, SYNC_KEYS['student'], ids=student_ids),
+    'professors': ImportSpec(Professor, 4, parse_professor, SYNC_KEYS['professor'], ids=professor_ids),
+    'courses': ImportSpec(Course, 5, parse_course, SYNC_KEYS['course']),
+    'enrollments': ImportSpec(Enrollment, 4, parse_enrollment, SYNC_KEYS['enrollment']),
+    'payments': ImportSpec(TuitionPayment, 6, parse_payment, SYNC_KEYS['tuition_payment'],
+                           sync_required=[(4, 'Payment Date')]),
+}
+
+
+class ImportResult:
+    def __init__(self, name, mode):
+        self.name = name
+        self.mode = mode
+        self.processed = 0
+        self.written = 0
+        self.error_count = 0
+        self.errors = []
+        # Sync modes only
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.deleted = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    @property
+    def rows_per_sec(self):
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def changes(self):
+        return {'inserted': self.inserted, 'updated': self.updated,
+                'unchanged': self.unchanged, 'deleted': self.deleted}
+
+
+def _statement(spec, mode):
+    stmt = insert(spec.model.__table__)
+    if mode == 'upsert':
+        updates = [c.name for c in spec.model.__table__.columns if c.name not in spec.natural_key and not c.primary_key]
+        return stmt.on_conflict_do_update(index_elements=spec.natural_key,
+                                          set_={name: stmt.excluded[name] for name in updates})
+    if mode == 'skip':
+        return stmt.on_conflict_do_nothing()
+    return stmt
+
+
+def _assign_ids(spec, batch):
+    # Reserved and committed before the batch is written, so the IDs stay
+    # reserved even if the batch has to be replayed row by row.
+    connection = db.session.connection()
+    missing = [values for _, values in batch if values['id'] is None]
+    if missing:
+        for values, new_id in zip(missing, spec.ids.allocate(connection, len(missing))):
+            values['id'] = new_id
+    spec.ids.advance_past(connection, [values['id'] for _, values in batch])
+    db.session.commit()
+
+
+def _write_batch(stmt, batch, result):
+    # One executemany per batch; if the batch is rejected, replay it row by row
+    # so only the offending rows are reported and everything else still lands.
+    # Returns the rows that were accepted.
+    try:
+        outcome = db.session.execute(stmt, [values for _, values in batch])
+        db.session.commit()
+        result.written += outcome.rowcount if outcome.rowcount >= 0 else len(batch)
+        return batch
+    except DBAPIError:
+        db.session.rollback()
+    accepted = []
+    for line, values in batch:
+        try:
+            outcome = db.session.execute(stmt, values)
+            db.session.commit()
+            result.written += max(outcome.rowcount, 0)
+            accepted.append((line, values))
+        except DBAPIError as e:
+            db.session.rollback()
+            result.add_error(line, str(e.orig))
+    return accepted
+
+
+def _current_digests(spec, rows):
+    # Rows without a stored hash are compared against what the table holds now
+    keys = [tuple(values[c] for c in spec.natural_key) for values in rows]
+    columns = [spec.table.c[c] for c in spec.hashed_columns]
+    current = db.session.execute(db.select(*columns).where(spec.key_filter(keys))).mappings()
+    return {spec.key(row): spec.digest(row) for row in current}
+
+
+def _store_hashes(spec, hashes):
+    stmt = insert(RowHash.__table__)
+    stmt = stmt.on_conflict_do_update(index_elements=['table_name', 'row_key'], set_={'digest': stmt.excluded.digest})
+    db.session.execute(stmt, [{'table_name': spec.table.name, 'row_key': key, 'digest': digest}
+                              for key, digest in hashes.items()])
+    db.session.commit()
+
+
+def _sync_batch(spec, stmt, batch, result, seen):
+    # Hash each row and write (upsert) only those whose hash differs from the stored one,
+    # so an unchanged nightly feed costs one indexed lookup per batch and no writes
+    entries = [(line, values, spec.key(values), spec.digest(values)) for line, values in batch]
+    if seen is not None:
+        seen.update(key for _, _, key, _ in entries)
+    stored = dict(db.session.execute(
+        db.select(RowHash.row_key, RowHash.digest)
+        .where(RowHash.table_name == spec.table.name, RowHash.row_key.in_([key for _, _, key, _ in entries]))
+    ).all())
+    current = dict(stored)
+    unknown = [values for _, values, key, _ in entries if key not in stored]
+    if unknown:
+        current.update(_current_digests(spec, unknown))
+
+    changed = [(line, values) for line, values, key, digest in entries if current.get(key) != digest]
+    result.unchanged += len(entries) - len(changed)
+    hashes = {key: digest for _, _, key, digest in entries if key not in stored and current.get(key) == digest}
+    if changed:
+        if spec.ids:
+            _assign_ids(spec, changed)
+        for line, values in _write_batch(stmt, changed, result):
+            key = spec.key(values)
+            if key in current:
+                result.updated += 1
+            else:
+                result.inserted += 1
+            hashes[key] = spec.digest(values)
+    if hashes:
+        _store_hashes(spec, hashes)
+
+
+def _delete_missing(spec, seen, result):
+    # One pass over the table's natural keys, then set-based deletes of those not in the file.
+    # Cascading children are deleted through the session too, so their versions move with them.
+    columns = [spec.table.c[c] for c in spec.natural_key]
+    missing = [tuple(row[c] for c in spec.natural_key)
+               for row in db.session.execute(db.select(*columns)).mappings() if spec.key(row) not in seen]
+    for start in range(0, len(missing), BATCH_SIZE):
+        chunk = missing[start:start + BATCH_SIZE]
+        counts = {}
+        try:
+            cascade_delete(spec.table, spec.key_filter(chunk), counts)
+            db.session.commit()
+            result.deleted += counts.get(spec.table.name, 0)
+        except DeleteRestricted as e:
+            db.session.rollback()
+            result.add_error(0, f"deleting rows missing from the file: {e}")
+        except DBAPIError as e:
+            db.session.rollback()
+            result.add_error(0, f"deleting rows missing from the file: {e.orig}")
+
+
+def _flush(spec, stmt, batch, result, progress, seen=None):
+    if result.mode in SYNC_MODES:
+        _sync_batch(spec, stmt, batch, result, seen)
+    else:
+        if spec.ids:
+            _assign_ids(spec, batch)
+        _write_batch(stmt, batch, result)
+    if progress:
+        result.elapsed = time.perf_counter() - result.started
+        progress(result)
+
+
+def run_import(name, binary_stream, mode='insert', batch_size=None, progress=None):
+    # `progress(result)` is called after each committed batch
+    spec = IMPORT_SPECS[name]
+    batch_size = batch_size or current_app.config.get('IMPORT_BATCH_SIZE', BATCH_SIZE)
+    stmt = _statement(spec, 'upsert' if mode in SYNC_MODES else mode)
+    result = ImportResult(name, mode)
+    # Natural keys present in the file, for sync_delete
+    seen = set() if mode == 'sync_delete' else None
+
+    # Decode the upload incrementally rather than reading it into memory
+    stream = io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
+    reader = csv.reader(stream)
+    batch = []
+    try:
+        next(reader, None)  # Skip header
+        for row in reader:
+            if not any(field.strip() for field in row):
+                continue
+            result.processed += 1
+            if len(row) < spec.columns:
+                result.add_error(reader.line_num, f"expected {spec.columns} columns, got {len(row)}")
+                continue
+            if mode in SYNC_MODES:
+                blank = [field for index, field in spec.sync_required if not row[index].strip()]
+                if blank:
+                    result.add_error(reader.line_num, f"{', '.join(blank)} is required when syncing")
+                    continue
+            try:
+                batch.append((reader.line_num, spec.parse(row)))
+            except ValueError as e:
+                result.add_error(reader.line_num, str(e))
+                continue
+            if len(batch) >= batch_size:
+                _flush(spec, stmt, batch, result, progress, seen)
+                batch = []
+        if batch:
+            _flush(spec, stmt, batch, result, progress, seen)
+    except (UnicodeDecodeError, csv.Error) as e:
+        result.add_error(reader.line_num, f"unreadable file: {e}")
+    finally:
+        stream.detach()
+
+    if seen is not None:
+        # A rejected or unreadable row would look like a deleted one
+        if result.error_count:
+            result.add_error(0, "rows missing from the file were not deleted because the file has errors")
+        else:
+            _delete_missing(spec, seen, result)
+
+    result.elapsed = time.perf_counter() - result.started
+    current_app.logger.info(
+        "import %s (%s): %d rows, %d written, %d errors in %.2fs (%.0f rows/sec)%s",
+        name, mode, result.processed, result.written, result.error_count, result.elapsed, result.rows_per_sec,
+        f" {result.changes}" if mode in SYNC_MODES else '',
+    )
+    return result
+
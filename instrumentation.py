@@ -0,0 +1,253 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from bisect import bisect_left
+from flask import Response, g, has_app_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+from database import db
+
+slow_query_log = logging.getLogger('university.slow_query')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+MAX_LOGGED_PARAMS = 500
+PROFILE_INTERVAL = 0.005
+
+
+class Histogram:
+    def __init__(self, name, help, buckets, labels=('endpoint',)):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.setdefault(label_values, [[0] * (len(self.buckets) + 1), 0.0, 0])
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for label_values, (counts, total, count) in series:
+            labels = ','.join(f'{k}="{v}"' for k, v in zip(self.labels, label_values))
+            cumulative = 0
+            for bound, bucket in zip(list(self.buckets) + ['+Inf'], counts):
+                cumulative += bucket
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {count}")
+        return lines
+
+
+class Counters:
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values):
+        with self._lock:
+            self._values[label_values] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            labels = ','.join(f'{k}="{v}"' for k, v in zip(self.labels, label_values))
+            lines.append(f"{self.name}{{{labels}}} {value}" if labels else f"{self.name} {value}")
+        return lines
+
+
+class Gauges(Counters):
+    type = 'gauge'
+
+    def set(self, value, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+
+# Per-process: with several gunicorn workers each exposes its own share
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Wall time spent handling a request',
+                            LATENCY_BUCKETS, ('endpoint', 'method', 'status'))
+DB_SECONDS = Histogram('http_request_db_seconds', 'Time spent executing SQL per request', LATENCY_BUCKETS)
+RENDER_SECONDS = Histogram('http_request_render_seconds', 'Template render time per request', LATENCY_BUCKETS)
+STATEMENTS = Histogram('http_request_sql_statements', 'SQL statements executed per request', STATEMENT_BUCKETS)
+SLOW_STATEMENTS = Counters('sql_slow_statements_total', 'Statements slower than SLOW_QUERY_MS')
+STARTUP_SECONDS = Gauges('app_startup_seconds', 'Time this process took to reach each startup phase', ('phase',))
+METRICS = [REQUEST_SECONDS, DB_SECONDS, RENDER_SECONDS, STATEMENTS, SLOW_STATEMENTS, STARTUP_SECONDS]
+
+
+def _explain(connection, statement, parameters):
+    # Straight through the DBAPI cursor, so it is neither timed nor logged itself
+    cursor = connection.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        return ' | '.join(str(row[-1]) for row in cursor.fetchall())
+    except Exception as e:
+        return f"unavailable: {e}"
+    finally:
+        cursor.close()
+
+
+class SamplingProfiler:
+    # One daemon thread samples the stacks of threads currently serving a request. Requests
+    # slower than the threshold are written as folded stacks ("a;b;c count"), which
+    # flamegraph.pl and speedscope read directly.
+
+    def __init__(self, directory, threshold, interval=PROFILE_INTERVAL):
+        self.directory = directory
+        self.threshold = threshold
+        self.interval = interval
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, thread_id):
+        with self._lock:
+            self._active[thread_id] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+                self._thread.start()
+
+    def stop(self, thread_id):
+        with self._lock:
+            return self._active.pop(thread_id, None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, stacks in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[self._fold(frame)] += 1
+
+    @staticmethod
+    def _fold(frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def dump(self, stacks, endpoint, elapsed):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{elapsed * 1000:.0f}ms.folded")
+        with open(path, 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+def init_instrumentation(app):
+    # Per-request wall/DB/render time and statement counts, a slow statement log with query
+    # plans, Prometheus text on /metrics and, with PROFILE_SLOW_REQUESTS, a sampling profiler.
+    app.config.setdefault('SLOW_QUERY_MS', float(os.environ.get('SLOW_QUERY_MS', 100)))
+    app.config.setdefault('PROFILE_SLOW_REQUESTS', os.environ.get('PROFILE_SLOW_REQUESTS') == '1')
+    app.config.setdefault('PROFILE_THRESHOLD_MS', float(os.environ.get('PROFILE_THRESHOLD_MS', 500)))
+    slow_seconds = app.config['SLOW_QUERY_MS'] / 1000
+    profiler = None
+    if app.config['PROFILE_SLOW_REQUESTS']:
+        profiler = SamplingProfiler(os.path.join(app.instance_path, 'profiles'),
+                                    app.config['PROFILE_THRESHOLD_MS'] / 1000)
+
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_statement(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('statement_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def finish_statement(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['statement_started'].pop()
+        if has_app_context() and 'request_started' in g:
+            g.db_time += elapsed
+            g.statements += 1
+        if elapsed >= slow_seconds:
+            SLOW_STATEMENTS.inc()
+            plan = _explain(conn, statement, parameters) if not executemany else 'executemany'
+            slow_query_log.warning("slow statement (%.1fms): %s params=%.*s plan=%s", elapsed * 1000, statement,
+                                   MAX_LOGGED_PARAMS, repr(parameters), plan)
+
+    @event.listens_for(engine, 'handle_error')
+    def discard_statement(exception_context):
+        if exception_context.connection is not None:
+            started = exception_context.connection.info.get('statement_started')
+            if started:
+                started.pop()
+
+    @before_render_template.connect_via(app)
+    def start_render(sender, template, context, **extra):
+        if 'request_started' in g:
+            g.render_started = time.perf_counter()
+
+    @template_rendered.connect_via(app)
+    def finish_render(sender, template, context, **extra):
+        if 'render_started' in g:
+            g.render_time += time.perf_counter() - g.pop('render_started')
+
+    @app.before_request
+    def start_request():
+        g.request_started = time.perf_counter()
+        g.db_time = g.render_time = 0.0
+        g.statements = 0
+        if profiler:
+            profiler.start(threading.get_ident())
+
+    def record(state, endpoint, method, status):
+        REQUEST_SECONDS.observe(time.perf_counter() - state.request_started, endpoint, method, status)
+        DB_SECONDS.observe(state.db_time, endpoint)
+        RENDER_SECONDS.observe(state.render_time, endpoint)
+        STATEMENTS.observe(state.statements, endpoint)
+
+    @app.after_request
+    def finish_request(response):
+        if 'request_started' not in g:
+            return response
+        elapsed = time.perf_counter() - g.request_started
+        endpoint = request.endpoint or 'unmatched'
+        if response.is_streamed:
+            # Exports keep querying while the body streams: record once it has been sent
+            state, method, status = g._get_current_object(), request.method, str(response.status_code)
+            response.call_on_close(lambda: record(state, endpoint, method, status))
+        else:
+            record(g, endpoint, request.method, str(response.status_code))
+        response.headers['Server-Timing'] = (f"app;dur={elapsed * 1000:.1f}, db;dur={g.db_time * 1000:.1f}, "
+                                             f"render;dur={g.render_time * 1000:.1f}")
+        response.headers['X-SQL-Statements'] = str(g.statements)
+        if profiler:
+            stacks = profiler.stop(threading.get_ident())
+            if stacks and elapsed >= profiler.threshold:
+                path = profiler.dump(stacks, endpoint, elapsed)
+                app.logger.info("profiled slow request %s (%.0fms): %s", request.path, elapsed * 1000, path)
+        return response
+
+    @app.teardown_request
+    def discard_profile(exc):
+        if profiler:
+            profiler.stop(threading.get_ident())
+
+    def metrics():
+        lines = []
+        for metric in METRICS:
+            lines.extend(metric.render())
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics)
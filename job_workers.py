@@ -0,0 +1,42 @@
+import json
+import os
+import socket
+from sqlalchemy import select, update, func
+from models import Job
+
+# Which process runs each job, and failing the jobs of processes that are gone. Kept apart
+# from jobs.py so startup hooks can use it without loading the import/export code.
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _alive(worker):
+    host, _, pid = (worker or '').rpartition(':')
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def fail_orphaned_jobs(connection, job_ids=None):
+    # Queued and running jobs whose worker exited (recycled, restarted, redeployed) would
+    # otherwise stay active forever; returns how many were marked failed
+    query = select(Job.id, Job.params).where(Job.status.in_(ACTIVE_STATUSES))
+    if job_ids is not None:
+        query = query.where(Job.id.in_(job_ids))
+    orphaned = [(job_id, json.loads(params).get('worker')) for job_id, params in connection.execute(query)]
+    orphaned = [(job_id, worker) for job_id, worker in orphaned if not _alive(worker)]
+    for job_id, worker in orphaned:
+        connection.execute(
+            update(Job).where(Job.id == job_id, Job.status.in_(ACTIVE_STATUSES))
+            .values(status='failed', finished_at=func.current_timestamp(), error_count=Job.error_count + 1,
+                    errors=json.dumps([[None, f"worker {worker or 'unknown'} exited before the job finished"]])))
+    return len(orphaned)
@@ -0,0 +1,136 @@
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from database import db
+from models import Job
+from exports import EXPORT_COLUMNS, iter_csv, gzip_chunks
+from importer import run_import, MAX_REPORTED_ERRORS
+from import_modes import SYNC_MODES
+from job_workers import worker_id
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+# Seconds between progress writes for exports
+PROGRESS_INTERVAL = 1.0
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='job')
+    return _executor
+
+
+def job_dir():
+    path = os.path.join(current_app.instance_path, 'jobs')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _create(kind, target, **params):
+    # Jobs run in the executor of the process that created them, recorded as `worker`
+    job = Job(id=uuid.uuid4().hex, kind=kind, target=target, params=json.dumps(dict(params, worker=worker_id())))
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def _update(job_id, **values):
+    # On a connection of its own: an export is still reading through db.session meanwhile
+    with db.engine.begin() as connection:
+        connection.execute(db.update(Job).where(Job.id == job_id).values(**values))
+
+
+def _submit(job_id, work):
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            _update(job_id, status='running', started_at=db.func.current_timestamp())
+            try:
+                work(job_id)
+                _update(job_id, status='done', finished_at=db.func.current_timestamp())
+            except Exception as e:
+                db.session.rollback()
+                app.logger.exception("job %s failed", job_id)
+                _update(job_id, status='failed', finished_at=db.func.current_timestamp(),
+                        errors=json.dumps([[None, str(e)]]), error_count=Job.error_count + 1)
+
+    _get_executor().submit(run)
+
+
+def enqueue_import(name, file, mode):
+    # The upload is spooled to disk in the request; parsing and inserting happen in the pool
+    job = _create('import', name, mode=mode, filename=file.filename)
+    params = json.loads(job.params)
+    path = os.path.join(job_dir(), f"{job.id}.upload.csv")
+    file.save(path)
+
+    def work(job_id):
+        def progress(result):
+            values = {}
+            if mode in SYNC_MODES:
+                # The running change summary travels with the job's parameters
+                values['params'] = json.dumps(dict(params, changes=result.changes))
+            _update(job_id, rows_processed=result.processed, rows_written=result.written,
+                    error_count=result.error_count, rows_per_sec=result.rows_per_sec,
+                    errors=json.dumps(result.errors), **values)
+        try:
+            with open(path, 'rb') as f:
+                progress(run_import(name, f, mode, progress=progress))
+        finally:
+            os.remove(path)
+
+    _submit(job.id, work)
+    return job
+
+
+def enqueue_export(name, gzip=False):
+    job = _create('export', name, gzip=gzip)
+    filename = f"{name}.csv.gz" if gzip else f"{name}.csv"
+
+    def work(job_id):
+        header, columns = EXPORT_COLUMNS[name]
+        state = {'rows': 0, 'reported': time.perf_counter()}
+        started = time.perf_counter()
+
+        def progress(count):
+            state['rows'] += count
+            now = time.perf_counter()
+            if now - state['reported'] >= PROGRESS_INTERVAL:
+                state['reported'] = now
+                _update(job_id, rows_processed=state['rows'], rows_per_sec=state['rows'] / (now - started))
+
+        chunks = iter_csv(header, columns, progress=progress)
+        path = os.path.join(job_dir(), f"{job_id}.{filename}")
+        with open(path, 'wb') as f:
+            for chunk in (gzip_chunks(chunks) if gzip else chunks):
+                f.write(chunk if gzip else chunk.encode('utf-8'))
+        elapsed = time.perf_counter() - started
+        _update(job_id, rows_processed=state['rows'], rows_written=state['rows'],
+                rows_per_sec=state['rows'] / elapsed if elapsed else 0.0, artifact=os.path.basename(path))
+
+    _submit(job.id, work)
+    return job
+
+
+def job_status(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'target': job.target,
+        'status': job.status,
+        'rows_processed': job.rows_processed,
+        'rows_written': job.rows_written,
+        'rows_per_sec': round(job.rows_per_sec, 1),
+        'error_count': job.error_count,
+        'errors': json.loads(job.errors)[:MAX_REPORTED_ERRORS],
+        'changes': json.loads(job.params).get('changes'),
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
@@ -0,0 +1,123 @@
+import sys
+from sqlalchemy import func, text
+from sqlalchemy.schema import CreateTable
+from app import create_app, db
+from models import Student, Professor, Course, Enrollment, TuitionPayment
+from summaries import install_triggers
+from search import SEARCH_INDEXES, install_search, rebuild_search
+from row_hashes import install_sync_triggers
+
+app = create_app()
+
+# Queries behind the list pages, relationship loads and reports, with the index each must use
+PLAN_CHECKS = [
+    ('students by major', db.select(Student).where(Student.major == 'x').order_by(Student.id), 'ix_student_major'),
+    ('professors by department', db.select(Professor).where(Professor.department == 'x').order_by(Professor.id),
+     'ix_professor_department'),
+    ('courses by professor', db.select(Course).where(Course.professor_id == 'x'), 'ix_course_professor_id'),
+    ('enrollments by student', db.select(Enrollment).where(Enrollment.student_id == 'x'),
+     'uq_enrollment_student_course'),
+    ('enrollments by course', db.select(Enrollment).where(Enrollment.course_id == 1).order_by(Enrollment.id),
+     'ix_enrollment_course_id'),
+    ('grades by course', db.select(Enrollment.course_id, Enrollment.grade, func.count())
+     .group_by(Enrollment.course_id, Enrollment.grade), 'ix_enrollment_course_grade'),
+    ('payments by student', db.select(TuitionPayment).where(TuitionPayment.student_id == 'x'),
+     'ix_tuition_payment_student_course'),
+    ('payments by course', db.select(TuitionPayment).where(TuitionPayment.course_id == 1).order_by(TuitionPayment.id),
+     'ix_tuition_payment_course_id'),
+    ('payments by status and date', db.select(TuitionPayment).where(TuitionPayment.status == 'x')
+     .order_by(TuitionPayment.payment_date), 'ix_tuition_payment_status_date'),
+    ('payments sorted by date', db.select(TuitionPayment).order_by(TuitionPayment.payment_date.desc(),
+                                                                    TuitionPayment.id.desc()).limit(50),
+     'ix_tuition_payment_payment_date'),
+]
+
+
+def find_duplicates(connection, index):
+    columns = list(index.columns)
+    return connection.execute(
+        db.select(*columns, func.count()).group_by(*columns).having(func.count() > 1).limit(10)
+    ).all()
+
+
+def rebuild_foreign_keys():
+    # SQLite cannot alter a constraint in place: tables whose foreign keys lack the ON DELETE
+    # rules declared in models.py are copied into a replacement table, with enforcement off
+    # so dropping the old one cascades nothing. Their indexes are recreated by the caller.
+    with db.engine.connect() as connection:
+        connection.exec_driver_sql("PRAGMA foreign_keys=OFF")
+        rebuilt = []
+        for table in db.metadata.sorted_tables:
+            expected = {(fk.parent.name, (fk.ondelete or 'NO ACTION').upper()) for fk in table.foreign_keys}
+            actual = {(row[3], row[6]) for row in connection.exec_driver_sql(f"PRAGMA foreign_key_list({table.name})")}
+            if expected != actual:
+                rebuilt.append(table.name)
+                columns = ', '.join(c.name for c in table.columns)
+                ddl = str(CreateTable(table).compile(dialect=connection.dialect)).strip()
+                # Triggers are dropped with every table; reinstalled below
+                for (name,) in connection.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'trigger'").all():
+                    connection.exec_driver_sql(f"DROP TRIGGER {name}")
+                connection.exec_driver_sql(ddl.replace(f"CREATE TABLE {table.name} ", f"CREATE TABLE {table.name}_new ", 1))
+                connection.exec_driver_sql(f"INSERT INTO {table.name}_new ({columns}) SELECT {columns} FROM {table.name}")
+                connection.exec_driver_sql(f"DROP TABLE {table.name}")
+                connection.exec_driver_sql(f"ALTER TABLE {table.name}_new RENAME TO {table.name}")
+        if rebuilt:
+            install_triggers(connection)
+            install_search(connection)
+            install_sync_triggers(connection)
+            stale = [kind for kind, (table, _, _) in SEARCH_INDEXES.items() if table in rebuilt]
+            if stale:
+                rebuild_search(connection, stale)
+        orphans = connection.exec_driver_sql("PRAGMA foreign_key_check").all()
+        connection.commit()
+        connection.exec_driver_sql("PRAGMA foreign_keys=ON")
+    for name in rebuilt:
+        print(f"Rebuilt {name} with the ON DELETE rules from models.py")
+    if orphans:
+        tables = sorted({row[0] for row in orphans})
+        print(f"Warning: {len(orphans)} rows in {', '.join(tables)} reference missing rows, e.g. {orphans[:5]}")
+
+
+def migrate_database():
+    # Brings an existing university.db up to date with models.py in place: missing
+    # tables and indexes are created, tables with outdated foreign keys are rebuilt,
+    # existing rows are never changed.
+    with app.app_context():
+        db.create_all()
+        rebuild_foreign_keys()
+        skipped = []
+        with db.engine.begin() as connection:
+            for table in db.metadata.sorted_tables:
+                for index in sorted(table.indexes, key=lambda i: i.name):
+                    if index.unique:
+                        duplicates = find_duplicates(connection, index)
+                        if duplicates:
+                            skipped.append((index.name, duplicates))
+                            continue
+                    index.create(connection, checkfirst=True)
+            connection.execute(text('ANALYZE'))
+        for name, duplicates in skipped:
+            print(f"Skipped {name}: duplicate rows must be resolved first, e.g. {duplicates}")
+        print("Database migration complete!")
+        return not skipped
+
+
+def check_query_plans():
+    with app.app_context():
+        failures = 0
+        with db.engine.connect() as connection:
+            for label, statement, index_name in PLAN_CHECKS:
+                compiled = statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+                plan = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}").all()
+                details = ' | '.join(row[-1] for row in plan)
+                ok = f"INDEX {index_name}" in details
+                failures += not ok
+                print(f"{'ok  ' if ok else 'FAIL'} {label}: {details}")
+        return failures == 0
+
+
+if __name__ == "__main__":
+    ok = migrate_database()
+    if '--check' in sys.argv:
+        ok = check_query_plans() and ok
+    sys.exit(0 if ok else 1)
@@ -1,67 +1,174 @@
 from database import db
 from sqlalchemy import event
+from sqlalchemy.orm import Session
+from id_sequence import IdAllocator
+# Installs the row_hash triggers whenever create_all runs
+import row_hashes
+
+student_ids = IdAllocator('student', 's', 'student')
+professor_ids = IdAllocator('professor', 'i', 'professor')
+
+# Tuition billed per course credit
+TUITION_PER_CREDIT = 20
 
 def generate_student_id(mapper, connection, target):
     if not target.id:
-        last_student = connection.execute(
-            db.select(Student.id).order_by(Student.id.desc()).limit(1)
-        ).scalar()
-        if last_student:
-            num = int(last_student[1:]) + 1
-        else:
-            num = 1
-        target.id = f"s{num:04d}"
+        target.id = student_ids.next_id(connection)
 
 def generate_professor_id(mapper, connection, target):
     if not target.id:
-        last_professor = connection.execute(
-            db.select(Professor.id).order_by(Professor.id.desc()).limit(1)
-        ).scalar()
-        if last_professor:
-            num = int(last_professor[1:]) + 1
-        else:
-            num = 1
-        target.id = f"i{num:04d}"
+        target.id = professor_ids.next_id(connection)
+
+class IdSequence(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    next_value = db.Column(db.Integer, nullable=False)
+
+class TableVersion(db.Model):
+    # Bumped on every change to a table; drives ETags and rendered-page caching
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
+
+class GradePoint(db.Model):
+    # Seeded from analytics.GRADE_POINTS; enrollment grades are matched upper-cased and trimmed
+    grade = db.Column(db.String(2), primary_key=True)
+    points = db.Column(db.Float, nullable=False)
+    counts_toward_gpa = db.Column(db.Boolean, nullable=False, default=True)
 
 class Student(db.Model):
     id = db.Column(db.String(10), primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(100), unique=True, nullable=False)
     major = db.Column(db.String(100), nullable=False)
-    enrollments = db.relationship('Enrollment', backref='student', lazy=True)
+    enrollments = db.relationship('Enrollment', backref='student', lazy=True, cascade='all, delete', passive_deletes=True)
+
+    __table_args__ = (
+        db.Index('ix_student_major', 'major', 'id'),
+    )
 
 class Professor(db.Model):
     id = db.Column(db.String(10), primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(100), unique=True, nullable=False)
     department = db.Column(db.String(100), nullable=False)
-    courses = db.relationship('Course', backref='professor', lazy=True)
+    courses = db.relationship('Course', backref='professor', lazy=True, passive_deletes='all')
+
+    __table_args__ = (
+        db.Index('ix_professor_department', 'department', 'id'),
+    )
+
+ID_ALLOCATORS = {Student: student_ids, Professor: professor_ids}
+
+def advance_past_explicit_ids(session, flush_context, instances):
+    # IDs assigned by hand (populate.py, edits that set an id) must never be handed out later
+    explicit = {}
+    for obj in list(session.new) + list(session.dirty):
+        allocator = ID_ALLOCATORS.get(type(obj))
+        if allocator and obj.id and (obj in session.new or db.inspect(obj).attrs.id.history.added):
+            explicit.setdefault(allocator, []).append(obj.id)
+    for allocator, ids in explicit.items():
+        allocator.advance_past(session.connection(), ids)
 
 # Register event listeners
 event.listen(Student, 'before_insert', generate_student_id)
 event.listen(Professor, 'before_insert', generate_professor_id)
+event.listen(Session, 'before_flush', advance_past_explicit_ids)
 
 class Course(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     code = db.Column(db.String(20), unique=True, nullable=False)
     credits = db.Column(db.Integer, nullable=False, default=3)
-    professor_id = db.Column(db.String(10), db.ForeignKey('professor.id'), nullable=False)
-    enrollments = db.relationship('Enrollment', backref='course', lazy=True)
+    # A professor's courses must be reassigned or removed before the professor
+    professor_id = db.Column(db.String(10), db.ForeignKey('professor.id', ondelete='RESTRICT'), nullable=False)
+    enrollments = db.relationship('Enrollment', backref='course', lazy=True, cascade='all, delete', passive_deletes=True)
+
+    __table_args__ = (
+        db.Index('ix_course_professor_id', 'professor_id'),
+    )
 
 class Enrollment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    student_id = db.Column(db.String(10), db.ForeignKey('student.id'), nullable=False)
-    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
+    student_id = db.Column(db.String(10), db.ForeignKey('student.id', ondelete='CASCADE'), nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id', ondelete='CASCADE'), nullable=False)
     grade = db.Column(db.String(2), nullable=True)
 
+    __table_args__ = (
+        # A student is enrolled in a course at most once; also serves per-student lookups
+        db.Index('uq_enrollment_student_course', 'student_id', 'course_id', unique=True),
+        db.Index('ix_enrollment_course_id', 'course_id'),
+        # Covers the per-(course, grade) counts behind the grade analytics
+        db.Index('ix_enrollment_course_grade', 'course_id', 'grade'),
+    )
+
 class TuitionPayment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    student_id = db.Column(db.String(10), db.ForeignKey('student.id'), nullable=False)
-    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
+    # Payments go with the student, but keep a course with payments from being deleted
+    student_id = db.Column(db.String(10), db.ForeignKey('student.id', ondelete='CASCADE'), nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id', ondelete='RESTRICT'), nullable=False)
     amount_paid = db.Column(db.Float, nullable=False)
     payment_date = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
     status = db.Column(db.String(20), nullable=False, default='paid')  # paid, pending, overdue
 
-    student = db.relationship('Student', backref='payments')
-    course = db.relationship('Course', backref='payments')
\ No newline at end of file
+    student = db.relationship('Student', backref=db.backref('payments', cascade='all, delete', passive_deletes=True))
+    course = db.relationship('Course', backref=db.backref('payments', passive_deletes='all'))
+
+    __table_args__ = (
+        db.Index('ix_tuition_payment_student_course', 'student_id', 'course_id'),
+        db.Index('ix_tuition_payment_course_id', 'course_id'),
+        db.Index('ix_tuition_payment_status_date', 'status', 'payment_date'),
+        db.Index('ix_tuition_payment_payment_date', 'payment_date'),
+    )
+
+class StudentBalance(db.Model):
+    # Maintained by the triggers in summaries.py; rebuild with rebuild_summaries.py
+    student_id = db.Column(db.String(10), primary_key=True)
+    enrollment_count = db.Column(db.Integer, nullable=False, server_default='0')
+    billed = db.Column(db.Float, nullable=False, server_default='0')
+    payment_count = db.Column(db.Integer, nullable=False, server_default='0')
+    paid = db.Column(db.Float, nullable=False, server_default='0')
+    pending = db.Column(db.Float, nullable=False, server_default='0')
+    overdue = db.Column(db.Float, nullable=False, server_default='0')
+
+    @property
+    def owed(self):
+        return self.billed - self.paid
+
+class CourseRevenue(db.Model):
+    # Maintained by the triggers in summaries.py; rebuild with rebuild_summaries.py
+    course_id = db.Column(db.Integer, primary_key=True)
+    professor_id = db.Column(db.String(10), nullable=True)
+    enrollment_count = db.Column(db.Integer, nullable=False, server_default='0')
+    billed = db.Column(db.Float, nullable=False, server_default='0')
+    payment_count = db.Column(db.Integer, nullable=False, server_default='0')
+    paid = db.Column(db.Float, nullable=False, server_default='0')
+    pending = db.Column(db.Float, nullable=False, server_default='0')
+    overdue = db.Column(db.Float, nullable=False, server_default='0')
+
+    __table_args__ = (
+        db.Index('ix_course_revenue_professor_id', 'professor_id'),
+    )
+
+class RowHash(db.Model):
+    # Content hash of each row as last synced by importer.py, keyed by its natural key;
+    # triggers drop the hash whenever the row is written any other way
+    table_name = db.Column(db.String(50), primary_key=True)
+    row_key = db.Column(db.String(255), primary_key=True)
+    digest = db.Column(db.String(32), nullable=False)
+
+class Job(db.Model):
+    # Background import/export run by jobs.py; polled through /university/jobs/<id>
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # import, export
+    target = db.Column(db.String(20), nullable=False)  # students, professors, ...
+    params = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    rows_processed = db.Column(db.Integer, nullable=False, default=0)
+    rows_written = db.Column(db.Integer, nullable=False, default=0)
+    error_count = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.Text, nullable=False, default='[]')
+    rows_per_sec = db.Column(db.Float, nullable=False, default=0.0)
+    artifact = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
@@ -0,0 +1,70 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from flask import abort
+from sqlalchemy import String, tuple_, type_coerce
+
+PER_PAGE = 50
+MAX_PER_PAGE = 200
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        if not isinstance(values, list) or len(values) != size:
+            raise ValueError(token)
+        return values
+    except (ValueError, TypeError, binascii.Error):
+        abort(400, 'Invalid pagination cursor')
+
+
+class KeysetPage:
+    def __init__(self, items, sort, next_cursor, prev_cursor, args):
+        self.items = items
+        self.sort = sort
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        # Filters and sort to carry over into next/prev links
+        self.args = args
+
+
+def keyset_paginate(query, sorts, pk, args, default_sort='id'):
+    # Seeks past the (sort column, primary key) of the last row seen instead of using
+    # OFFSET, so every page costs the same no matter how deep it is.
+    # `sorts` maps the accepted ?sort= names to non-nullable columns; prefix with '-' for descending.
+    sort = args.get('sort', default_sort)
+    descending = sort.startswith('-')
+    if sort.lstrip('-') not in sorts:
+        sort, descending = default_sort, False
+    column = sorts[sort.lstrip('-')]
+    keys = [pk] if column is pk else [column, pk]
+    # Compare datetimes as the stored text: rows written by the server default and by
+    # Python use different formats, so a re-serialised cursor would not round-trip.
+    keys = [type_coerce(k, String) if k.type.python_type is datetime else k for k in keys]
+    per_page = min(max(args.get('per_page', PER_PAGE, type=int), 1), MAX_PER_PAGE)
+
+    after, before = args.get('after'), args.get('before')
+    backwards = bool(before)
+    cursor = before or after
+    if cursor:
+        values = decode_cursor(cursor, len(keys))
+        key, value = (keys[0], values[0]) if len(keys) == 1 else (tuple_(*keys), tuple_(*values))
+        query = query.filter(key < value if descending != backwards else key > value)
+
+    ascending = descending == backwards
+    query = query.order_by(*[k.asc() if ascending else k.desc() for k in keys])
+    rows = query.add_columns(*keys).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    next_cursor = encode_cursor(rows[-1][1:]) if rows and (has_more or backwards) else None
+    prev_cursor = encode_cursor(rows[0][1:]) if rows and cursor and (has_more or not backwards) else None
+    carried = {k: v for k, v in args.items() if k not in ('after', 'before') and v}
+    return KeysetPage([row[0] for row in rows], sort, next_cursor, prev_cursor, carried)
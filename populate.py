@@ -1,7 +1,9 @@
-from app import app, db
+from app import create_app, db
 from models import Student, Professor, Course, Enrollment, TuitionPayment
 from datetime import datetime
 
+app = create_app()
+
 def populate_database():
     with app.app_context():
         # Create sample professors
@@ -0,0 +1,29 @@
+from functools import wraps
+from flask import current_app, g
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(max_queries):
+    # Caps the number of SQL statements a view may issue, template rendering included.
+    # Enforced when the app runs in debug/testing mode or SQL_QUERY_BUDGET is set; statements
+    # are the per-request count kept by instrumentation.py.
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            enforce = current_app.config.get('SQL_QUERY_BUDGET', current_app.debug or current_app.testing)
+            if not enforce:
+                return view(*args, **kwargs)
+            before = g.statements
+            response = view(*args, **kwargs)
+            used = g.statements - before
+            if used > max_queries:
+                raise QueryBudgetExceeded(
+                    f"{view.__name__} issued {used} SQL statements (budget {max_queries})"
+                )
+            return response
+        wrapper.query_budget = max_queries
+        return wrapper
+    return decorator
@@ -0,0 +1,15 @@
+from app import create_app, db
+from search import install_search, rebuild_search
+
+app = create_app()
+
+def rebuild():
+    with app.app_context():
+        db.create_all()
+        with db.engine.begin() as connection:
+            install_search(connection)
+            rebuild_search(connection)
+        print("Search index rebuilt!")
+
+if __name__ == "__main__":
+    rebuild()
@@ -0,0 +1,15 @@
+from app import create_app, db
+from summaries import install_triggers, rebuild_summaries
+
+app = create_app()
+
+def rebuild():
+    with app.app_context():
+        db.create_all()
+        with db.engine.begin() as connection:
+            install_triggers(connection)
+            rebuild_summaries(connection)
+        print("Financial summaries rebuilt!")
+
+if __name__ == "__main__":
+    rebuild()
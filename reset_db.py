@@ -1,4 +1,6 @@
-from app import app, db
+from app import create_app, db
+
+app = create_app()
 
 def reset_database():
     with app.app_context():
@@ -0,0 +1,28 @@
+import sys
+import time
+from app import create_app, db
+from snapshot import restore_snapshot
+
+# Restart the app (all gunicorn workers) once a restore has finished: running workers keep
+# the ID blocks they reserved before it, which may overlap restored students or professors
+RESTART_NOTE = "Restart the app (all gunicorn workers) before it creates new students or professors"
+
+app = create_app()
+
+def restore(path):
+    # Replaces the configured database's data with the snapshot's, all or nothing
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        with db.engine.connect() as connection:
+            # Explicit, so the trigger DDL is rolled back with the data if anything fails
+            connection.exec_driver_sql("BEGIN")
+            counts = restore_snapshot(connection, path)
+            connection.commit()
+        print(f"Restored {counts} in {time.perf_counter() - started:.1f}s")
+        print(RESTART_NOTE)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit(f"usage: python restore_db.py <snapshot.zip>\n{RESTART_NOTE}")
+    restore(sys.argv[1])
@@ -0,0 +1,30 @@
+from sqlalchemy import event, text
+from database import db
+
+# Natural key of each table a sync import writes; RowHash.row_key joins its values with
+# KEY_SEPARATOR. Loaded by models.py so create_all always installs the triggers below.
+SYNC_KEYS = {
+    'student': ['email'],
+    'professor': ['email'],
+    'course': ['code'],
+    'enrollment': ['student_id', 'course_id'],
+    'tuition_payment': ['id'],
+}
+KEY_SEPARATOR = '\x1f'
+
+
+def install_sync_triggers(connection):
+    # Any write to a row that does not go through a sync import drops its stored hash,
+    # so the next sync compares that row against the table instead
+    for table, natural_key in SYNC_KEYS.items():
+        for action, row in (('insert', 'NEW'), ('update', 'OLD'), ('delete', 'OLD')):
+            key = ' || char(31) || '.join(f"{row}.{c}" for c in natural_key)
+            connection.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS trg_{table}_row_hash_{action} AFTER {action.upper()} ON {table} "
+                f"BEGIN DELETE FROM row_hash WHERE table_name = '{table}' AND row_key = {key}; END"))
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _after_create_all(metadata, connection, tables=(), **kw):
+    if connection.dialect.name == 'sqlite':
+        install_sync_triggers(connection)
@@ -0,0 +1,90 @@
+import re
+from sqlalchemy import event, text
+from database import db
+
+# One external-content FTS5 index per table, keyed by the table's rowid. The triggers keep
+# the indexes in step with every write, ORM or Core. Rowids of tables without an INTEGER
+# primary key may be renumbered by VACUUM: run rebuild_search.py after one.
+SEARCH_INDEXES = {
+    'students': ('student', 'student_search', ['name', 'email', 'major']),
+    'professors': ('professor', 'professor_search', ['name', 'email', 'department']),
+    'courses': ('course', 'course_search', ['name', 'code']),
+}
+# bm25 column weights: matches in a name count most
+SEARCH_WEIGHTS = {'students': (10.0, 2.0, 1.0), 'professors': (10.0, 2.0, 1.0), 'courses': (10.0, 5.0)}
+SEARCH_SELECTS = {
+    'students': "SELECT 'students' AS kind, t.id AS id, t.name AS label, t.email || ' · ' || t.major AS detail",
+    'professors': "SELECT 'professors' AS kind, t.id AS id, t.name AS label, t.email || ' · ' || t.department AS detail",
+    'courses': "SELECT 'courses' AS kind, CAST(t.id AS TEXT) AS id, t.name AS label, t.code AS detail",
+}
+MAX_TERMS = 8
+# bm25 is computed for every row a query matches; very broad queries (a two-letter prefix
+# over a million names) are ranked among their first SEARCH_CANDIDATES matches per index
+SEARCH_CANDIDATES = 5000
+
+
+def _ddl(table, index, columns):
+    cols = ', '.join(columns)
+    new = ', '.join(f"NEW.{c}" for c in columns)
+    old = ', '.join(f"OLD.{c}" for c in columns)
+    delete = f"INSERT INTO {index} ({index}, rowid, {cols}) VALUES ('delete', OLD.rowid, {old});"
+    insert = f"INSERT INTO {index} (rowid, {cols}) VALUES (NEW.rowid, {new});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {index} USING fts5({cols}, content='{table}', content_rowid='rowid', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS trg_{index}_insert AFTER INSERT ON {table} BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_{index}_delete AFTER DELETE ON {table} BEGIN {delete} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_{index}_update AFTER UPDATE OF {cols} ON {table} BEGIN {delete} {insert} END",
+    ]
+
+
+def install_search(connection):
+    created = []
+    for kind, (table, index, columns) in SEARCH_INDEXES.items():
+        exists = connection.execute(text("SELECT 1 FROM sqlite_master WHERE name = :name"), {'name': index}).first()
+        for statement in _ddl(table, index, columns):
+            connection.execute(text(statement))
+        if not exists:
+            created.append(kind)
+    return created
+
+
+def rebuild_search(connection, kinds=None):
+    for kind in kinds or SEARCH_INDEXES:
+        index = SEARCH_INDEXES[kind][1]
+        connection.execute(text(f"INSERT INTO {index} ({index}) VALUES ('rebuild')"))
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _after_create_all(metadata, connection, tables=(), **kw):
+    if connection.dialect.name != 'sqlite':
+        return
+    created = {table.name for table in tables}
+    # New indexes, and indexes whose content table was just (re)created, start out of step
+    stale = set(install_search(connection))
+    stale.update(kind for kind, (table, _, _) in SEARCH_INDEXES.items() if table in created)
+    if stale:
+        rebuild_search(connection, sorted(stale))
+
+
+def match_expression(q):
+    # Each word becomes a quoted prefix term, so user input can never be FTS5 syntax
+    terms = re.findall(r"\w+", q, re.UNICODE)[:MAX_TERMS]
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search(q, kinds=None, limit=50, offset=0):
+    # Ranked (bm25) matches across the requested indexes; returns (rows, has_more)
+    expression = match_expression(q)
+    if not expression:
+        return [], False
+    parts = []
+    for kind in kinds or SEARCH_INDEXES:
+        table, index, _ = SEARCH_INDEXES[kind]
+        weights = ', '.join(str(w) for w in SEARCH_WEIGHTS[kind])
+        candidates = (f"SELECT rowid, bm25({index}, {weights}) AS rank FROM {index} "
+                      f"WHERE {index} MATCH :q LIMIT {SEARCH_CANDIDATES}")
+        parts.append(f"{SEARCH_SELECTS[kind]}, m.rank AS rank FROM ({candidates}) m JOIN {table} t ON t.rowid = m.rowid")
+    statement = text(f"SELECT * FROM ({' UNION ALL '.join(parts)}) ORDER BY rank, kind, id LIMIT :limit OFFSET :offset")
+    rows = db.session.execute(statement, {'q': expression, 'limit': limit + 1, 'offset': offset}).mappings().all()
+    return rows[:limit], len(rows) > limit
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import zipfile
+from datetime import datetime
+from flask import Response, stream_with_context
+from sqlalchemy import text
+from database import db
+from models import IdSequence, GradePoint, Professor, Student, Course, Enrollment, TuitionPayment, ID_ALLOCATORS
+from summaries import install_triggers, rebuild_summaries
+from search import install_search, rebuild_search
+from row_hashes import install_sync_triggers
+from versions import bump_versions
+
+SNAPSHOT_FORMAT = 1
+CHUNK_SIZE = 1000
+RESTORE_BATCH_SIZE = 10000
+MANIFEST = 'manifest.json'
+
+# Source data only, parents before children; summaries, search indexes and sync hashes are
+# derived and rebuilt on restore, jobs and table versions are local state
+SNAPSHOT_TABLES = [model.__table__ for model in
+                   (IdSequence, GradePoint, Professor, Student, Course, Enrollment, TuitionPayment)]
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class _Chunks:
+    # Write-only file for zipfile: it cannot seek, so members are written with data
+    # descriptors, and whatever has been written so far is handed to the response by take()
+
+    def __init__(self):
+        self._parts = []
+        self._offset = 0
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def iter_snapshot(chunk_size=CHUNK_SIZE):
+    # A zip of one NDJSON member per table (one JSON array per row, columns listed in the
+    # manifest) plus manifest.json with row counts and SHA-256 checksums, streamed as it is
+    # built. Every table is read inside one read transaction, so the archive is consistent
+    # however long the download takes; WAL lets writers carry on meanwhile.
+    out = _Chunks()
+    manifest = {'format': SNAPSHOT_FORMAT, 'created_at': datetime.now().isoformat(), 'tables': []}
+    with db.engine.connect() as connection:
+        # pysqlite only opens transactions for writes: begin the read transaction explicitly
+        connection.exec_driver_sql("BEGIN")
+        with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=6) as archive:
+            for table in SNAPSHOT_TABLES:
+                member = f"{table.name}.ndjson"
+                digest = hashlib.sha256()
+                rows = 0
+                result = connection.execution_options(yield_per=chunk_size).execute(
+                    db.select(table).order_by(*table.primary_key.columns))
+                with archive.open(member, 'w', force_zip64=True) as f:
+                    for partition in result.partitions():
+                        data = ''.join(json.dumps(list(row), separators=(',', ':'), default=_default) + '\n'
+                                       for row in partition).encode('utf-8')
+                        digest.update(data)
+                        f.write(data)
+                        rows += len(partition)
+                        yield out.take()
+                manifest['tables'].append({'name': table.name, 'file': member, 'rows': rows,
+                                           'sha256': digest.hexdigest(), 'columns': [c.name for c in table.columns]})
+            archive.writestr(MANIFEST, json.dumps(manifest, indent=2))
+        connection.rollback()
+    yield out.take()
+
+
+def snapshot_filename():
+    return f"university-snapshot-{datetime.now():%Y%m%d-%H%M%S}.zip"
+
+
+def snapshot_response():
+    return Response(stream_with_context(iter_snapshot()), mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename={snapshot_filename()}'})
+
+
+def _converters(table, columns):
+    unknown = set(columns) - set(table.columns.keys())
+    if unknown:
+        raise ValueError(f"{table.name}: unknown columns {', '.join(sorted(unknown))}")
+    parsers = []
+    for name in columns:
+        python_type = table.columns[name].type.python_type
+        parsers.append(datetime.fromisoformat if python_type is datetime else None)
+    return parsers
+
+
+def _load(connection, archive, entry, batch_size):
+    table = db.metadata.tables[entry['name']]
+    columns = entry['columns']
+    parsers = _converters(table, columns)
+    digest = hashlib.sha256()
+    rows = 0
+    batch = []
+    with archive.open(entry['file']) as f:
+        for line in f:
+            digest.update(line)
+            values = json.loads(line)
+            batch.append({name: parse(value) if parse and value is not None else value
+                          for name, parse, value in zip(columns, parsers, values)})
+            if len(batch) >= batch_size:
+                connection.execute(table.insert(), batch)
+                rows += len(batch)
+                batch = []
+    if batch:
+        connection.execute(table.insert(), batch)
+        rows += len(batch)
+    if rows != entry['rows'] or digest.hexdigest() != entry['sha256']:
+        raise ValueError(f"{entry['file']}: expected {entry['rows']} rows with checksum {entry['sha256']}, "
+                         f"read {rows} rows with checksum {digest.hexdigest()}")
+    return rows
+
+
+def restore_snapshot(connection, path, batch_size=RESTORE_BATCH_SIZE):
+    # Replaces the snapshot tables' contents with the archive's in one transaction: triggers
+    # are dropped for the load, tables are filled parents first with batched executemany
+    # inserts, then ID sequences are moved past both the old counters and the restored IDs
+    # and triggers, summaries and search indexes are rebuilt. Any row count or
+    # checksum mismatch raises, and the caller's transaction rolls everything back.
+    with zipfile.ZipFile(path) as archive:
+        manifest = json.loads(archive.read(MANIFEST))
+        if manifest.get('format') != SNAPSHOT_FORMAT:
+            raise ValueError(f"unsupported snapshot format {manifest.get('format')}")
+        entries = {entry['name']: entry for entry in manifest['tables']}
+        missing = [table.name for table in SNAPSHOT_TABLES if table.name not in entries]
+        if missing:
+            raise ValueError(f"snapshot has no {', '.join(missing)}")
+
+        # Blocks running workers reserved from the current counters must not be handed out again
+        sequences = dict(connection.execute(db.select(IdSequence.name, IdSequence.next_value)).all())
+        for (name,) in connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'trigger'")).all():
+            connection.execute(text(f"DROP TRIGGER {name}"))
+        for table in reversed(SNAPSHOT_TABLES):
+            connection.execute(table.delete())
+        connection.execute(text("DELETE FROM row_hash"))
+        counts = {table.name: _load(connection, archive, entries[table.name], batch_size)
+                  for table in SNAPSHOT_TABLES}
+
+    for allocator in ID_ALLOCATORS.values():
+        allocator.advance_past_existing(connection, sequences.get(allocator.name, 0))
+    install_triggers(connection)
+    rebuild_summaries(connection)
+    install_search(connection)
+    rebuild_search(connection)
+    install_sync_triggers(connection)
+    bump_versions(connection, counts)
+    connection.execute(text("ANALYZE"))
+    return counts
@@ -0,0 +1,69 @@
+import time
+
+# wsgi.py and startup_report.py import this module before anything else, so the clock
+# starts about as early as Python code can see
+_started = time.perf_counter()
+
+import os
+from jinja2 import FileSystemBytecodeCache
+from database import db
+from instrumentation import STARTUP_SECONDS
+
+# Seconds from the start of this process (or from the fork, in a worker) until it reached
+# each phase: import (create_app called), create_app, warm_up and first_response
+PHASES = {}
+
+
+def mark(phase):
+    # The first time a phase is reached is the one that counts
+    if phase not in PHASES:
+        PHASES[phase] = time.perf_counter() - _started
+        STARTUP_SECONDS.set(round(PHASES[phase], 6), phase)
+
+
+def restart():
+    # A forked worker inherits the master's imports and app; its own startup begins here
+    global _started
+    _started = time.perf_counter()
+    for phase in ('warm_up', 'first_response'):
+        PHASES.pop(phase, None)
+
+
+def report():
+    return ', '.join(f"{phase} {seconds * 1000:.0f}ms" for phase, seconds in PHASES.items())
+
+
+def init_startup(app):
+    # Must run before anything touches app.jinja_env, which is built from jinja_options once.
+    # Compiled templates are kept on disk, so a new process loads them instead of compiling.
+    mark('import')
+    app.config.setdefault('TEMPLATE_CACHE_DIR', os.environ.get('TEMPLATE_CACHE_DIR',
+                                                               os.path.join(app.instance_path, 'jinja_cache')))
+    app.config.setdefault('WARM_UP', os.environ.get('WARM_UP', '1') == '1')
+    if app.config['TEMPLATE_CACHE_DIR']:
+        os.makedirs(app.config['TEMPLATE_CACHE_DIR'], exist_ok=True)
+        app.jinja_options = {**app.jinja_options,
+                             'bytecode_cache': FileSystemBytecodeCache(app.config['TEMPLATE_CACHE_DIR'])}
+
+    @app.after_request
+    def first_response(response):
+        if 'first_response' not in PHASES:
+            mark('first_response')
+            app.logger.info("startup: %s", report())
+        return response
+
+
+def warm_up(app):
+    # Compiles every template and opens the pool's connections (running the connect
+    # PRAGMAs), so the first requests after a deploy or a worker recycle pay for neither
+    env = app.jinja_env
+    for name in env.list_templates(extensions=['html']):
+        env.get_template(name)
+    with app.app_context():
+        engine = db.engine
+    # In-memory SQLite's StaticPool has a single connection and no size()
+    connections = [engine.connect() for _ in range(getattr(engine.pool, 'size', lambda: 1)())]
+    for connection in connections:
+        connection.exec_driver_sql("SELECT 1")
+        connection.close()
+    mark('warm_up')
@@ -0,0 +1,28 @@
+import startup  # first, so the clock starts before the app's imports
+import argparse
+import json
+import sys
+from app import create_app
+from startup import PHASES, report, warm_up
+
+# python startup_report.py [--path /university/] [--no-warm-up] [--json]
+# Run in a fresh process each time: a second create_app in the same one measures nothing
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Time a cold start up to the first response')
+    parser.add_argument('--path', default='/', help='URL requested as the first response')
+    parser.add_argument('--no-warm-up', action='store_true')
+    parser.add_argument('--json', action='store_true', help='Print seconds per phase as JSON')
+    args = parser.parse_args(argv)
+
+    app = create_app()
+    if app.config['WARM_UP'] and not args.no_warm_up:
+        warm_up(app)
+    status = app.test_client().get(args.path).status_code
+    print(json.dumps(PHASES) if args.json else f"{report()} (GET {args.path}: {status})")
+    return status < 400
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main(sys.argv[1:]) else 1)
@@ -0,0 +1,28 @@
+// Selects rendered with data-typeahead only contain the current value;
+// a search box above them loads matching options from the typeahead endpoint.
+document.querySelectorAll('select[data-typeahead]').forEach(function (select) {
+    var input = document.createElement('input');
+    input.type = 'search';
+    input.className = 'form-control mb-1';
+    input.placeholder = 'Type to search...';
+    select.parentNode.insertBefore(input, select);
+
+    function load() {
+        var url = select.dataset.typeahead + '?q=' + encodeURIComponent(input.value);
+        fetch(url).then(function (response) { return response.json(); }).then(function (matches) {
+            select.innerHTML = '';
+            matches.forEach(function (match) {
+                select.add(new Option(match.label, match.id));
+            });
+        });
+    }
+
+    var timer = null;
+    input.addEventListener('input', function () {
+        clearTimeout(timer);
+        timer = setTimeout(load, 200);
+    });
+    if (!select.options.length) {
+        load();
+    }
+});
@@ -0,0 +1,142 @@
+from sqlalchemy import event, text
+from database import db
+from models import TUITION_PER_CREDIT, StudentBalance, CourseRevenue
+
+# The summary tables are maintained by SQLite triggers rather than ORM events, so bulk
+# Core inserts/deletes (imports, bulk deletes, restores) keep them correct as well.
+
+def _payment_delta(row, sign):
+    # SET clause adding (sign=+) or removing (sign=-) one payment row from a summary
+    return (f"paid = paid {sign} CASE WHEN {row}.status = 'paid' THEN {row}.amount_paid ELSE 0 END, "
+            f"pending = pending {sign} CASE WHEN {row}.status = 'pending' THEN {row}.amount_paid ELSE 0 END, "
+            f"overdue = overdue {sign} CASE WHEN {row}.status = 'overdue' THEN {row}.amount_paid ELSE 0 END, "
+            f"payment_count = payment_count {sign} 1")
+
+
+def _enrollment_delta(row, sign):
+    return (f"billed = billed {sign} COALESCE((SELECT credits FROM course WHERE id = {row}.course_id), 0) "
+            f"* {TUITION_PER_CREDIT}, enrollment_count = enrollment_count {sign} 1")
+
+
+def _ensure(row):
+    # NOT EXISTS rather than INSERT OR IGNORE: an UPSERT imposes its own conflict policy
+    # on the statements of the triggers it fires, so OR IGNORE would abort there
+    return (f"INSERT INTO student_balance (student_id) SELECT {row}.student_id WHERE NOT EXISTS "
+            f"(SELECT 1 FROM student_balance WHERE student_id = {row}.student_id); "
+            f"INSERT INTO course_revenue (course_id, professor_id) SELECT id, professor_id FROM course "
+            f"WHERE id = {row}.course_id AND NOT EXISTS (SELECT 1 FROM course_revenue WHERE course_id = {row}.course_id);")
+
+
+def _apply(row, sign, delta):
+    return (f"UPDATE student_balance SET {delta(row, sign)} WHERE student_id = {row}.student_id; "
+            f"UPDATE course_revenue SET {delta(row, sign)} WHERE course_id = {row}.course_id;")
+
+
+TRIGGERS = {
+    'trg_payment_insert': f"AFTER INSERT ON tuition_payment BEGIN {_ensure('NEW')} {_apply('NEW', '+', _payment_delta)} END",
+    'trg_payment_delete': f"AFTER DELETE ON tuition_payment BEGIN {_apply('OLD', '-', _payment_delta)} END",
+    'trg_payment_update': (f"AFTER UPDATE OF student_id, course_id, amount_paid, status ON tuition_payment BEGIN "
+                           f"{_apply('OLD', '-', _payment_delta)} {_ensure('NEW')} {_apply('NEW', '+', _payment_delta)} END"),
+    'trg_enrollment_insert': f"AFTER INSERT ON enrollment BEGIN {_ensure('NEW')} {_apply('NEW', '+', _enrollment_delta)} END",
+    'trg_enrollment_delete': f"AFTER DELETE ON enrollment BEGIN {_apply('OLD', '-', _enrollment_delta)} END",
+    'trg_enrollment_update': (f"AFTER UPDATE OF student_id, course_id ON enrollment BEGIN "
+                              f"{_apply('OLD', '-', _enrollment_delta)} {_ensure('NEW')} {_apply('NEW', '+', _enrollment_delta)} END"),
+    'trg_student_insert': ("AFTER INSERT ON student BEGIN "
+                           "INSERT INTO student_balance (student_id) SELECT NEW.id "
+                           "WHERE NOT EXISTS (SELECT 1 FROM student_balance WHERE student_id = NEW.id); END"),
+    'trg_student_delete': "AFTER DELETE ON student BEGIN DELETE FROM student_balance WHERE student_id = OLD.id; END",
+    'trg_course_insert': ("AFTER INSERT ON course BEGIN "
+                          "INSERT INTO course_revenue (course_id, professor_id) SELECT NEW.id, NEW.professor_id "
+                          "WHERE NOT EXISTS (SELECT 1 FROM course_revenue WHERE course_id = NEW.id); END"),
+    'trg_course_delete': "AFTER DELETE ON course BEGIN DELETE FROM course_revenue WHERE course_id = OLD.id; END",
+    'trg_course_professor': ("AFTER UPDATE OF professor_id ON course BEGIN "
+                             "UPDATE course_revenue SET professor_id = NEW.professor_id WHERE course_id = NEW.id; END"),
+    'trg_course_credits': (f"AFTER UPDATE OF credits ON course BEGIN "
+                           f"UPDATE student_balance SET billed = billed + (NEW.credits - OLD.credits) * {TUITION_PER_CREDIT} "
+                           f"* (SELECT COUNT(*) FROM enrollment e WHERE e.course_id = NEW.id AND e.student_id = student_balance.student_id) "
+                           f"WHERE student_id IN (SELECT student_id FROM enrollment WHERE course_id = NEW.id); "
+                           f"UPDATE course_revenue SET billed = enrollment_count * NEW.credits * {TUITION_PER_CREDIT} "
+                           f"WHERE course_id = NEW.id; END"),
+}
+
+REBUILD_STATEMENTS = [
+    "DELETE FROM student_balance",
+    "DELETE FROM course_revenue",
+    f"""INSERT INTO student_balance (student_id, enrollment_count, billed, payment_count, paid, pending, overdue)
+        SELECT s.id, COALESCE(e.enrollment_count, 0), COALESCE(e.billed, 0), COALESCE(p.payment_count, 0),
+               COALESCE(p.paid, 0), COALESCE(p.pending, 0), COALESCE(p.overdue, 0)
+        FROM (SELECT id FROM student
+              UNION SELECT student_id FROM enrollment
+              UNION SELECT student_id FROM tuition_payment) s
+        LEFT JOIN (SELECT e.student_id, COUNT(*) AS enrollment_count,
+                          SUM(COALESCE(c.credits, 0)) * {TUITION_PER_CREDIT} AS billed
+                   FROM enrollment e LEFT JOIN course c ON c.id = e.course_id
+                   GROUP BY e.student_id) e ON e.student_id = s.id
+        LEFT JOIN (SELECT student_id, COUNT(*) AS payment_count,
+                          SUM(CASE WHEN status = 'paid' THEN amount_paid ELSE 0 END) AS paid,
+                          SUM(CASE WHEN status = 'pending' THEN amount_paid ELSE 0 END) AS pending,
+                          SUM(CASE WHEN status = 'overdue' THEN amount_paid ELSE 0 END) AS overdue
+                   FROM tuition_payment GROUP BY student_id) p ON p.student_id = s.id""",
+    f"""INSERT INTO course_revenue (course_id, professor_id, enrollment_count, billed, payment_count, paid, pending, overdue)
+        SELECT c.id, c.professor_id, COALESCE(e.enrollment_count, 0),
+               COALESCE(e.enrollment_count, 0) * c.credits * {TUITION_PER_CREDIT}, COALESCE(p.payment_count, 0),
+               COALESCE(p.paid, 0), COALESCE(p.pending, 0), COALESCE(p.overdue, 0)
+        FROM course c
+        LEFT JOIN (SELECT course_id, COUNT(*) AS enrollment_count FROM enrollment GROUP BY course_id) e
+               ON e.course_id = c.id
+        LEFT JOIN (SELECT course_id, COUNT(*) AS payment_count,
+                          SUM(CASE WHEN status = 'paid' THEN amount_paid ELSE 0 END) AS paid,
+                          SUM(CASE WHEN status = 'pending' THEN amount_paid ELSE 0 END) AS pending,
+                          SUM(CASE WHEN status = 'overdue' THEN amount_paid ELSE 0 END) AS overdue
+                   FROM tuition_payment GROUP BY course_id) p ON p.course_id = c.id""",
+]
+
+
+def install_triggers(connection):
+    # Recreated every time so databases pick up changed trigger bodies
+    for name, body in TRIGGERS.items():
+        connection.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+        connection.execute(text(f"CREATE TRIGGER {name} {body}"))
+
+
+def rebuild_summaries(connection):
+    # Recomputes both summary tables from the ledger in one set-based pass
+    for statement in REBUILD_STATEMENTS:
+        connection.execute(text(statement))
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _after_create_all(metadata, connection, tables=(), **kw):
+    if connection.dialect.name != 'sqlite':
+        return
+    install_triggers(connection)
+    # Summary tables added to an existing database start out empty
+    if any(table.name in ('student_balance', 'course_revenue') for table in tables):
+        rebuild_summaries(connection)
+
+
+def student_balance(student_id):
+    return db.session.get(StudentBalance, student_id)
+
+
+def professor_revenue():
+    return db.session.execute(
+        db.select(CourseRevenue.professor_id,
+                  db.func.count(CourseRevenue.course_id).label('course_count'),
+                  db.func.sum(CourseRevenue.enrollment_count).label('enrollment_count'),
+                  db.func.sum(CourseRevenue.billed).label('billed'),
+                  db.func.sum(CourseRevenue.paid).label('paid'),
+                  db.func.sum(CourseRevenue.pending).label('pending'),
+                  db.func.sum(CourseRevenue.overdue).label('overdue'))
+        .group_by(CourseRevenue.professor_id)
+        .order_by(CourseRevenue.professor_id)
+    ).mappings().all()
+
+
+def totals():
+    return db.session.execute(
+        db.select(db.func.coalesce(db.func.sum(CourseRevenue.billed), 0).label('billed'),
+                  db.func.coalesce(db.func.sum(CourseRevenue.paid), 0).label('paid'),
+                  db.func.coalesce(db.func.sum(CourseRevenue.pending), 0).label('pending'),
+                  db.func.coalesce(db.func.sum(CourseRevenue.overdue), 0).label('overdue'))
+    ).mappings().one()
@@ -0,0 +1,111 @@
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from app import create_app, db
+from models import Student, Professor, Course, Enrollment, TuitionPayment, TUITION_PER_CREDIT, student_ids, professor_ids
+from summaries import install_triggers, rebuild_summaries
+from search import install_search, rebuild_search
+from row_hashes import install_sync_triggers
+
+# Enrollments and payments per scale; the other tables are sized from these
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+ENROLLMENTS_PER_STUDENT = 5
+INSERT_CHUNK = 10_000
+
+FIRST_NAMES = ['Alice', 'Bob', 'Charlie', 'Diana', 'Eve', 'Frank', 'Grace', 'Heidi', 'Ivan', 'Judy',
+               'Mallory', 'Niaj', 'Olivia', 'Peggy', 'Rupert', 'Sybil', 'Trent', 'Uma', 'Victor', 'Wendy']
+LAST_NAMES = ['Adams', 'Brown', 'Clark', 'Davis', 'Evans', 'Fischer', 'Garcia', 'Hughes', 'Ito', 'Jones',
+              'Khan', 'Lopez', 'Moore', 'Nguyen', 'Okafor', 'Patel', 'Quinn', 'Rossi', 'Smith', 'Tanaka']
+DEPARTMENTS = ['Computer Science', 'Mathematics', 'Physics', 'Chemistry', 'Biology', 'History',
+               'Economics', 'Philosophy', 'Literature', 'Engineering']
+SUBJECTS = ['Introduction to', 'Advanced', 'Topics in', 'Foundations of', 'Applied']
+GRADES = ['A', 'A-', 'B+', 'B', 'B-', 'C+', 'C', 'D', 'F', None]
+STATUSES = ['paid'] * 7 + ['pending'] * 2 + ['overdue']
+
+
+def _sizes(enrollments):
+    students = max(enrollments // ENROLLMENTS_PER_STUDENT, 10)
+    return {'professors': max(enrollments // 1000, 10), 'courses': max(enrollments // 200, 20),
+            'students': students, 'enrollments': students * ENROLLMENTS_PER_STUDENT, 'payments': enrollments}
+
+
+def _insert(connection, model, rows):
+    for start in range(0, len(rows), INSERT_CHUNK):
+        connection.execute(model.__table__.insert(), rows[start:start + INSERT_CHUNK])
+
+
+def _drop_triggers(connection):
+    # Summary, search and sync triggers are replaced by one set-based rebuild after the load
+    for (name,) in connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'trigger'")).all():
+        connection.execute(text(f"DROP TRIGGER {name}"))
+
+
+def generate(connection, scale='10k', seed=1):
+    # Bulk-loads a reproducible data set: the same scale and seed always produce the same rows.
+    # Expects empty tables (see reset_db.py); returns the row count per table.
+    rng = random.Random(seed)
+    sizes = _sizes(SCALES[scale])
+    now = datetime(2024, 9, 1)
+    _drop_triggers(connection)
+
+    professors = [{'id': professor_ids.format(i), 'name': f"Dr. {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                   'email': f"prof{i}@university.edu", 'department': DEPARTMENTS[i % len(DEPARTMENTS)]}
+                  for i in range(1, sizes['professors'] + 1)]
+    _insert(connection, Professor, professors)
+    professor_ids.advance_past(connection, [p['id'] for p in professors])
+
+    courses = [{'id': i, 'name': f"{rng.choice(SUBJECTS)} {professors[i % len(professors)]['department']} {i}",
+                'code': f"C{i:05d}", 'credits': rng.choice([1, 2, 3, 3, 4]),
+                'professor_id': professors[i % len(professors)]['id']}
+               for i in range(1, sizes['courses'] + 1)]
+    _insert(connection, Course, courses)
+    credits = {c['id']: c['credits'] for c in courses}
+
+    students = [{'id': student_ids.format(i), 'name': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                 'email': f"student{i}@student.edu", 'major': rng.choice(DEPARTMENTS)}
+                for i in range(1, sizes['students'] + 1)]
+    _insert(connection, Student, students)
+    student_ids.advance_past(connection, [s['id'] for s in students])
+
+    enrollments = []
+    for student in students:
+        for course_id in rng.sample(range(1, len(courses) + 1), ENROLLMENTS_PER_STUDENT):
+            enrollments.append({'id': len(enrollments) + 1, 'student_id': student['id'],
+                                'course_id': course_id, 'grade': rng.choice(GRADES)})
+    _insert(connection, Enrollment, enrollments)
+
+    payments = []
+    for i in range(1, sizes['payments'] + 1):
+        enrollment = enrollments[rng.randrange(len(enrollments))]
+        due = credits[enrollment['course_id']] * TUITION_PER_CREDIT
+        payments.append({'id': i, 'student_id': enrollment['student_id'], 'course_id': enrollment['course_id'],
+                         'amount_paid': float(due if rng.random() < 0.8 else rng.randint(1, due)),
+                         'payment_date': now - timedelta(seconds=rng.randrange(365 * 24 * 3600)),
+                         'status': rng.choice(STATUSES)})
+    _insert(connection, TuitionPayment, payments)
+
+    install_triggers(connection)
+    rebuild_summaries(connection)
+    install_search(connection)
+    rebuild_search(connection)
+    install_sync_triggers(connection)
+    connection.execute(text("ANALYZE"))
+    return {name: len(rows) for name, rows in
+            [('professors', professors), ('courses', courses), ('students', students),
+             ('enrollments', enrollments), ('payments', payments)]}
+
+
+if __name__ == "__main__":
+    # python synthetic_data.py [10k|100k|1m] [seed] -- replaces the configured database's contents
+    scale = sys.argv[1] if len(sys.argv) > 1 else '10k'
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    app = create_app()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        started = time.perf_counter()
+        with db.engine.begin() as connection:
+            counts = generate(connection, scale, seed)
+        print(f"Generated {counts} in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,41 @@
+from unittest import mock
+import pytest
+from app import create_app, db
+from models import Student, Professor, Course, Enrollment, TuitionPayment
+import synthetic_data
+
+# Every view decorated with @query_budget, requested against a few hundred rows with TESTING
+# on, so a view that goes N+1 raises QueryBudgetExceeded instead of passing with one row
+
+ID_MODELS = {'/api/students/<id>': Student, '/api/professors/<id>': Professor, '/api/courses/<id>': Course,
+             '/api/enrollments/<id>': Enrollment, '/api/payments/<id>': TuitionPayment}
+QUERY_STRINGS = {'/university/search': {'q': 'intro'}}
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    path = tmp_path_factory.mktemp('db') / 'university.db'
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{path}", 'TESTING': True,
+                      'TEMPLATE_CACHE_DIR': None, 'WARM_UP': False})
+    with app.app_context():
+        db.create_all()
+        with mock.patch.dict(synthetic_data.SCALES, {'test': 500}), db.engine.begin() as connection:
+            synthetic_data.generate(connection, 'test')
+    return app
+
+
+def _budgeted_rules():
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'TEMPLATE_CACHE_DIR': None})
+    return sorted(rule.rule for rule in app.url_map.iter_rules()
+                  if hasattr(app.view_functions[rule.endpoint], 'query_budget'))
+
+
+@pytest.mark.parametrize('rule', _budgeted_rules())
+def test_query_budget(app, rule):
+    url = rule
+    if rule in ID_MODELS:
+        with app.app_context():
+            model = ID_MODELS[rule]
+            url = rule.replace('<id>', str(db.session.scalars(db.select(model.id).order_by(model.id)).first()))
+    response = app.test_client().get(url, query_string=QUERY_STRINGS.get(rule, {}))
+    assert response.status_code == 200
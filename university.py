@@ -1,13 +1,25 @@
-from flask import Blueprint, render_template, request, redirect, url_for, Response, send_from_directory
-from flask_sqlalchemy import SQLAlchemy
+from flask import Blueprint, render_template, request, redirect, url_for, send_from_directory, jsonify, abort
 from flask_wtf import FlaskForm
-from wtforms import StringField, IntegerField, SelectField, SubmitField, FileField
+from wtforms import StringField, IntegerField, SelectField, SubmitField, FileField, BooleanField
 from wtforms.validators import DataRequired, Length
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
 from database import db
 from models import *
-import csv
-import io
-from datetime import datetime
+from query_budget import query_budget
+from pagination import keyset_paginate
+# importer, exports, snapshot and jobs are imported inside the few routes that use them,
+# keeping them out of worker startup
+from import_modes import IMPORT_MODES
+from choices import get_choices, get_choice_list, limit_choices, CHOICE_QUERIES
+from gallery import GALLERY_CATEGORIES, BLOB_NAME, gallery_index, make_thumbnails, store_upload, blob_path, send_blob
+from versions import conditional
+from summaries import student_balance, professor_revenue, totals
+from analytics import transcript, course_grades, professor_grades, department_averages
+from search import SEARCH_INDEXES, search
+from job_workers import fail_orphaned_jobs
+from bulk_delete import BULK_DELETES, MAX_BULK_IDS, DeleteRestricted, bulk_delete
+from pagination import PER_PAGE, MAX_PER_PAGE
 import os
 
 university_bp = Blueprint('university', __name__, template_folder='templates', static_folder='static')
@@ -45,15 +57,31 @@ class PaymentForm(FlaskForm):
     status = SelectField('Status', choices=[('paid', 'Paid'), ('pending', 'Pending'), ('overdue', 'Overdue')], validators=[DataRequired()])
     submit = SubmitField('Submit')
 
+# Sortable columns for the paginated list routes
+STUDENT_SORTS = {'id': Student.id, 'name': Student.name, 'email': Student.email, 'major': Student.major}
+PROFESSOR_SORTS = {'id': Professor.id, 'name': Professor.name, 'email': Professor.email, 'department': Professor.department}
+COURSE_SORTS = {'id': Course.id, 'code': Course.code, 'name': Course.name, 'credits': Course.credits}
+ENROLLMENT_SORTS = {'id': Enrollment.id, 'student': Enrollment.student_id, 'course': Enrollment.course_id}
+BALANCE_SORTS = {'student': StudentBalance.student_id, 'billed': StudentBalance.billed, 'paid': StudentBalance.paid,
+                 'owed': StudentBalance.billed - StudentBalance.paid}
+REVENUE_SORTS = {'course': CourseRevenue.course_id, 'billed': CourseRevenue.billed, 'paid': CourseRevenue.paid,
+                 'pending': CourseRevenue.pending, 'overdue': CourseRevenue.overdue}
+PAYMENT_SORTS = {'id': TuitionPayment.id, 'date': TuitionPayment.payment_date, 'amount': TuitionPayment.amount_paid, 'status': TuitionPayment.status}
+
 # Routes
 @university_bp.route('/')
 def index():
     return render_template('index.html')
 
 @university_bp.route('/students')
+@query_budget(2)
+@conditional('student')
 def students():
-    students = Student.query.all()
-    return render_template('students.html', students=students)
+    query = Student.query
+    if request.args.get('major'):
+        query = query.filter(Student.major == request.args['major'])
+    page = keyset_paginate(query, STUDENT_SORTS, Student.id, request.args)
+    return render_template('students.html', students=page.items, page=page)
 
 @university_bp.route('/students/add', methods=['GET', 'POST'])
 def add_student():
@@ -79,15 +107,22 @@ def edit_student(id):
 
 @university_bp.route('/students/delete/<id>')
 def delete_student(id):
-    student = Student.query.get_or_404(id)
-    db.session.delete(student)
-    db.session.commit()
+    Student.query.get_or_404(id)
+    try:
+        bulk_delete('students', ids=[id])
+    except DeleteRestricted as e:
+        abort(409, str(e))
     return redirect(url_for('university.students'))
 
 @university_bp.route('/professors')
+@query_budget(2)
+@conditional('professor')
 def professors():
-    professors = Professor.query.all()
-    return render_template('professors.html', professors=professors)
+    query = Professor.query
+    if request.args.get('department'):
+        query = query.filter(Professor.department == request.args['department'])
+    page = keyset_paginate(query, PROFESSOR_SORTS, Professor.id, request.args)
+    return render_template('professors.html', professors=page.items, page=page)
 
 @university_bp.route('/professors/add', methods=['GET', 'POST'])
 def add_professor():
@@ -113,32 +148,42 @@ def edit_professor(id):
 
 @university_bp.route('/professors/delete/<id>')
 def delete_professor(id):
-    professor = Professor.query.get_or_404(id)
-    db.session.delete(professor)
-    db.session.commit()
+    Professor.query.get_or_404(id)
+    try:
+        bulk_delete('professors', ids=[id])
+    except DeleteRestricted as e:
+        abort(409, str(e))
     return redirect(url_for('university.professors'))
 
 @university_bp.route('/courses')
+@query_budget(2)
+@conditional('course', 'professor')
 def courses():
-    courses = Course.query.all()
-    return render_template('courses.html', courses=courses)
+    query = Course.query.options(joinedload(Course.professor))
+    if request.args.get('professor'):
+        query = query.filter(Course.professor_id == request.args['professor'])
+    if request.args.get('department'):
+        query = query.filter(Course.professor.has(Professor.department == request.args['department']))
+    page = keyset_paginate(query, COURSE_SORTS, Course.id, request.args)
+    return render_template('courses.html', courses=page.items, page=page, tuition_per_credit=TUITION_PER_CREDIT)
 
 @university_bp.route('/courses/add', methods=['GET', 'POST'])
 def add_course():
     form = CourseForm()
-    form.professor_id.choices = [(p.id, p.name) for p in Professor.query.all()]
+    form.professor_id.choices = get_choices('professors')
     if form.validate_on_submit():
         course = Course(name=form.name.data, code=form.code.data, credits=form.credits.data, professor_id=form.professor_id.data)
         db.session.add(course)
         db.session.commit()
         return redirect(url_for('university.courses'))
+    limit_choices(form.professor_id, 'professors')
     return render_template('add_course.html', form=form)
 
 @university_bp.route('/courses/edit/<int:id>', methods=['GET', 'POST'])
 def edit_course(id):
     course = Course.query.get_or_404(id)
     form = CourseForm(obj=course)
-    form.professor_id.choices = [(p.id, p.name) for p in Professor.query.all()]
+    form.professor_id.choices = get_choices('professors')
     if form.validate_on_submit():
         course.name = form.name.data
         course.code = form.code.data
@@ -146,44 +191,68 @@ def edit_course(id):
         course.professor_id = form.professor_id.data
         db.session.commit()
         return redirect(url_for('university.courses'))
+    limit_choices(form.professor_id, 'professors')
     return render_template('edit_course.html', form=form)
 
 @university_bp.route('/courses/delete/<int:id>')
 def delete_course(id):
-    course = Course.query.get_or_404(id)
-    db.session.delete(course)
-    db.session.commit()
+    Course.query.get_or_404(id)
+    try:
+        bulk_delete('courses', ids=[id])
+    except DeleteRestricted as e:
+        abort(409, str(e))
     return redirect(url_for('university.courses'))
 
 @university_bp.route('/enrollments')
+@query_budget(2)
+@conditional('enrollment', 'student', 'course')
 def enrollments():
-    enrollments = Enrollment.query.all()
-    return render_template('enrollments.html', enrollments=enrollments)
+    query = Enrollment.query.options(joinedload(Enrollment.student), joinedload(Enrollment.course))
+    if request.args.get('student'):
+        query = query.filter(Enrollment.student_id == request.args['student'])
+    if request.args.get('course', type=int):
+        query = query.filter(Enrollment.course_id == request.args.get('course', type=int))
+    page = keyset_paginate(query, ENROLLMENT_SORTS, Enrollment.id, request.args)
+    return render_template('enrollments.html', enrollments=page.items, page=page)
+
+def _commit_enrollment(form):
+    # A student takes each course once (unique student_id, course_id); the form shows the clash
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        form.course_id.errors = [*form.course_id.errors, "The student is already enrolled in this course."]
+        return False
+    return True
 
 @university_bp.route('/enrollments/add', methods=['GET', 'POST'])
 def add_enrollment():
     form = EnrollmentForm()
-    form.student_id.choices = [(s.id, s.name) for s in Student.query.all()]
-    form.course_id.choices = [(c.id, c.name) for c in Course.query.all()]
+    form.student_id.choices = get_choices('students')
+    form.course_id.choices = get_choices('courses')
     if form.validate_on_submit():
         enrollment = Enrollment(student_id=form.student_id.data, course_id=form.course_id.data, grade=form.grade.data)
         db.session.add(enrollment)
-        db.session.commit()
-        return redirect(url_for('university.enrollments'))
+        if _commit_enrollment(form):
+            return redirect(url_for('university.enrollments'))
+    limit_choices(form.student_id, 'students')
+    limit_choices(form.course_id, 'courses')
     return render_template('add_enrollment.html', form=form)
 
 @university_bp.route('/enrollments/edit/<int:id>', methods=['GET', 'POST'])
 def edit_enrollment(id):
     enrollment = Enrollment.query.get_or_404(id)
     form = EnrollmentForm(obj=enrollment)
-    form.student_id.choices = [(s.id, s.name) for s in Student.query.all()]
-    form.course_id.choices = [(c.id, c.name) for c in Course.query.all()]
+    form.student_id.choices = get_choices('students')
+    form.course_id.choices = get_choices('courses')
     if form.validate_on_submit():
         enrollment.student_id = form.student_id.data
         enrollment.course_id = form.course_id.data
         enrollment.grade = form.grade.data
-        db.session.commit()
-        return redirect(url_for('university.enrollments'))
+        if _commit_enrollment(form):
+            return redirect(url_for('university.enrollments'))
+    limit_choices(form.student_id, 'students')
+    limit_choices(form.course_id, 'courses')
     return render_template('edit_enrollment.html', form=form)
 
 @university_bp.route('/enrollments/delete/<int:id>')
@@ -194,15 +263,24 @@ def delete_enrollment(id):
     return redirect(url_for('university.enrollments'))
 
 @university_bp.route('/payments')
+@query_budget(2)
+@conditional('tuition_payment', 'student', 'course')
 def payments():
-    payments = TuitionPayment.query.all()
-    return render_template('payments.html', payments=payments)
+    query = TuitionPayment.query.options(joinedload(TuitionPayment.student), joinedload(TuitionPayment.course))
+    if request.args.get('status'):
+        query = query.filter(TuitionPayment.status == request.args['status'])
+    if request.args.get('student'):
+        query = query.filter(TuitionPayment.student_id == request.args['student'])
+    if request.args.get('course', type=int):
+        query = query.filter(TuitionPayment.course_id == request.args.get('course', type=int))
+    page = keyset_paginate(query, PAYMENT_SORTS, TuitionPayment.id, request.args)
+    return render_template('payments.html', payments=page.items, page=page, tuition_per_credit=TUITION_PER_CREDIT)
 
 @university_bp.route('/payments/add', methods=['GET', 'POST'])
 def add_payment():
     form = PaymentForm()
-    form.student_id.choices = [(s.id, s.name) for s in Student.query.all()]
-    form.course_id.choices = [(c.id, f"{c.name} ({c.code})") for c in Course.query.all()]
+    form.student_id.choices = get_choices('students')
+    form.course_id.choices = get_choices('courses')
     if form.validate_on_submit():
         payment = TuitionPayment(
             student_id=form.student_id.data,
@@ -213,14 +291,16 @@ def add_payment():
         db.session.add(payment)
         db.session.commit()
         return redirect(url_for('university.payments'))
+    limit_choices(form.student_id, 'students')
+    limit_choices(form.course_id, 'courses')
     return render_template('add_payment.html', form=form)
 
 @university_bp.route('/payments/edit/<int:id>', methods=['GET', 'POST'])
 def edit_payment(id):
     payment = TuitionPayment.query.get_or_404(id)
     form = PaymentForm(obj=payment)
-    form.student_id.choices = [(s.id, s.name) for s in Student.query.all()]
-    form.course_id.choices = [(c.id, f"{c.name} ({c.code})") for c in Course.query.all()]
+    form.student_id.choices = get_choices('students')
+    form.course_id.choices = get_choices('courses')
     if form.validate_on_submit():
         payment.student_id = form.student_id.data
         payment.course_id = form.course_id.data
@@ -228,6 +308,8 @@ def edit_payment(id):
         payment.status = form.status.data
         db.session.commit()
         return redirect(url_for('university.payments'))
+    limit_choices(form.student_id, 'students')
+    limit_choices(form.course_id, 'courses')
     return render_template('edit_payment.html', form=form)
 
 @university_bp.route('/payments/delete/<int:id>')
@@ -237,185 +319,315 @@ def delete_payment(id):
     db.session.commit()
     return redirect(url_for('university.payments'))
 
+# Typeahead for the student/professor/course selects
+@university_bp.route('/typeahead/<kind>')
+def typeahead(kind):
+    if kind not in CHOICE_QUERIES:
+        abort(404)
+    limit = min(request.args.get('limit', 20, type=int), 100)
+    matches = get_choice_list(kind).search(request.args.get('q', '').strip(), limit)
+    return jsonify([{'id': value, 'label': label} for value, label in matches])
+
 # Export routes
+def _export(name):
+    if request.args.get('background') == '1':
+        from jobs import enqueue_export
+        job = enqueue_export(name, gzip=request.args.get('gzip') == '1')
+        return redirect(url_for('university.job_detail', id=job.id))
+    from exports import csv_response
+    return csv_response(name, gzip=request.args.get('gzip') == '1')
+
 @university_bp.route('/students/export')
+@conditional('student', cache_html=False)
 def export_students():
-    students = Student.query.all()
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['ID', 'Name', 'Email', 'Major'])
-    for student in students:
-        writer.writerow([student.id, student.name, student.email, student.major])
-    output.seek(0)
-    return Response(output, mimetype='text/csv', headers={'Content-Disposition': 'attachment; filename=students.csv'})
+    return _export('students')
 
 @university_bp.route('/professors/export')
+@conditional('professor', cache_html=False)
 def export_professors():
-    professors = Professor.query.all()
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['ID', 'Name', 'Email', 'Department'])
-    for professor in professors:
-        writer.writerow([professor.id, professor.name, professor.email, professor.department])
-    output.seek(0)
-    return Response(output, mimetype='text/csv', headers={'Content-Disposition': 'attachment; filename=professors.csv'})
+    return _export('professors')
 
 @university_bp.route('/courses/export')
+@conditional('course', cache_html=False)
 def export_courses():
-    courses = Course.query.all()
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['ID', 'Name', 'Code', 'Credits', 'Professor ID'])
-    for course in courses:
-        writer.writerow([course.id, course.name, course.code, course.credits, course.professor_id])
-    output.seek(0)
-    return Response(output, mimetype='text/csv', headers={'Content-Disposition': 'attachment; filename=courses.csv'})
+    return _export('courses')
 
 @university_bp.route('/enrollments/export')
+@conditional('enrollment', cache_html=False)
 def export_enrollments():
-    enrollments = Enrollment.query.all()
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['ID', 'Student ID', 'Course ID', 'Grade'])
-    for enrollment in enrollments:
-        writer.writerow([enrollment.id, enrollment.student_id, enrollment.course_id, enrollment.grade])
-    output.seek(0)
-    return Response(output, mimetype='text/csv', headers={'Content-Disposition': 'attachment; filename=enrollments.csv'})
+    return _export('enrollments')
 
 @university_bp.route('/payments/export')
+@conditional('tuition_payment', cache_html=False)
 def export_payments():
-    payments = TuitionPayment.query.all()
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['ID', 'Student ID', 'Course ID', 'Amount Paid', 'Payment Date', 'Status'])
-    for payment in payments:
-        writer.writerow([payment.id, payment.student_id, payment.course_id, payment.amount_paid, payment.payment_date, payment.status])
-    output.seek(0)
-    return Response(output, mimetype='text/csv', headers={'Content-Disposition': 'attachment; filename=payments.csv'})
+    return _export('payments')
+
+# Whole-database backup (snapshot.py); restore with restore_db.py
+@university_bp.route('/snapshot')
+def snapshot():
+    from snapshot import snapshot_response
+    return snapshot_response()
 
 # Import forms
 class ImportStudentForm(FlaskForm):
     file = FileField('CSV File', validators=[DataRequired()])
+    mode = SelectField('Mode', choices=IMPORT_MODES, default='insert')
+    background = BooleanField('Run in background')
     submit = SubmitField('Import')
 
 class ImportProfessorForm(FlaskForm):
     file = FileField('CSV File', validators=[DataRequired()])
+    mode = SelectField('Mode', choices=IMPORT_MODES, default='insert')
+    background = BooleanField('Run in background')
     submit = SubmitField('Import')
 
 class ImportCourseForm(FlaskForm):
     file = FileField('CSV File', validators=[DataRequired()])
+    mode = SelectField('Mode', choices=IMPORT_MODES, default='insert')
+    background = BooleanField('Run in background')
     submit = SubmitField('Import')
 
 class ImportEnrollmentForm(FlaskForm):
     file = FileField('CSV File', validators=[DataRequired()])
+    mode = SelectField('Mode', choices=IMPORT_MODES, default='insert')
+    background = BooleanField('Run in background')
     submit = SubmitField('Import')
 
 class ImportPaymentForm(FlaskForm):
     file = FileField('CSV File', validators=[DataRequired()])
+    mode = SelectField('Mode', choices=IMPORT_MODES, default='insert')
+    background = BooleanField('Run in background')
     submit = SubmitField('Import')
 
 # Import routes
 @university_bp.route('/students/import', methods=['GET', 'POST'])
 def import_students():
     form = ImportStudentForm()
+    result = None
     if form.validate_on_submit():
-        file = form.file.data
-        stream = io.StringIO(file.stream.read().decode("UTF8"), newline=None)
-        reader = csv.reader(stream)
-        next(reader)  # Skip header
-        for row in reader:
-            if len(row) >= 4:
-                student = Student(id=row[0], name=row[1], email=row[2], major=row[3])
-                db.session.add(student)
-        db.session.commit()
-        return redirect(url_for('university.students'))
-    return render_template('import_students.html', form=form)
+        if form.background.data:
+            from jobs import enqueue_import
+            job = enqueue_import('students', form.file.data, form.mode.data)
+            return redirect(url_for('university.job_detail', id=job.id))
+        from importer import run_import
+        result = run_import('students', form.file.data.stream, form.mode.data)
+    return render_template('import_students.html', form=form, result=result)
 
 @university_bp.route('/professors/import', methods=['GET', 'POST'])
 def import_professors():
     form = ImportProfessorForm()
+    result = None
     if form.validate_on_submit():
-        file = form.file.data
-        stream = io.StringIO(file.stream.read().decode("UTF8"), newline=None)
-        reader = csv.reader(stream)
-        next(reader)  # Skip header
-        for row in reader:
-            if len(row) >= 4:
-                professor = Professor(id=row[0], name=row[1], email=row[2], department=row[3])
-                db.session.add(professor)
-        db.session.commit()
-        return redirect(url_for('university.professors'))
-    return render_template('import_professors.html', form=form)
+        if form.background.data:
+            from jobs import enqueue_import
+            job = enqueue_import('professors', form.file.data, form.mode.data)
+            return redirect(url_for('university.job_detail', id=job.id))
+        from importer import run_import
+        result = run_import('professors', form.file.data.stream, form.mode.data)
+    return render_template('import_professors.html', form=form, result=result)
 
 @university_bp.route('/courses/import', methods=['GET', 'POST'])
 def import_courses():
     form = ImportCourseForm()
+    result = None
     if form.validate_on_submit():
-        file = form.file.data
-        stream = io.StringIO(file.stream.read().decode("UTF8"), newline=None)
-        reader = csv.reader(stream)
-        next(reader)  # Skip header
-        for row in reader:
-            if len(row) >= 5:
-                course = Course(id=int(row[0]), name=row[1], code=row[2], credits=int(row[3]), professor_id=row[4])
-                db.session.add(course)
-        db.session.commit()
-        return redirect(url_for('university.courses'))
-    return render_template('import_courses.html', form=form)
+        if form.background.data:
+            from jobs import enqueue_import
+            job = enqueue_import('courses', form.file.data, form.mode.data)
+            return redirect(url_for('university.job_detail', id=job.id))
+        from importer import run_import
+        result = run_import('courses', form.file.data.stream, form.mode.data)
+    return render_template('import_courses.html', form=form, result=result)
 
 @university_bp.route('/enrollments/import', methods=['GET', 'POST'])
 def import_enrollments():
     form = ImportEnrollmentForm()
+    result = None
     if form.validate_on_submit():
-        file = form.file.data
-        stream = io.StringIO(file.stream.read().decode("UTF8"), newline=None)
-        reader = csv.reader(stream)
-        next(reader)  # Skip header
-        for row in reader:
-            if len(row) >= 4:
-                enrollment = Enrollment(id=int(row[0]), student_id=row[1], course_id=int(row[2]), grade=row[3] if row[3] else None)
-                db.session.add(enrollment)
-        db.session.commit()
-        return redirect(url_for('university.enrollments'))
-    return render_template('import_enrollments.html', form=form)
+        if form.background.data:
+            from jobs import enqueue_import
+            job = enqueue_import('enrollments', form.file.data, form.mode.data)
+            return redirect(url_for('university.job_detail', id=job.id))
+        from importer import run_import
+        result = run_import('enrollments', form.file.data.stream, form.mode.data)
+    return render_template('import_enrollments.html', form=form, result=result)
 
 @university_bp.route('/payments/import', methods=['GET', 'POST'])
 def import_payments():
     form = ImportPaymentForm()
+    result = None
     if form.validate_on_submit():
-        file = form.file.data
-        stream = io.StringIO(file.stream.read().decode("UTF8"), newline=None)
-        reader = csv.reader(stream)
-        next(reader)  # Skip header
-        for row in reader:
-            if len(row) >= 6:
-                payment_date = datetime.strptime(row[4], '%Y-%m-%d %H:%M:%S.%f') if row[4] else datetime.now()
-                payment = TuitionPayment(id=int(row[0]), student_id=row[1], course_id=int(row[2]), amount_paid=float(row[3]), payment_date=payment_date, status=row[5])
-                db.session.add(payment)
-        db.session.commit()
-        return redirect(url_for('university.payments'))
-    return render_template('import_payments.html', form=form)
+        if form.background.data:
+            from jobs import enqueue_import
+            job = enqueue_import('payments', form.file.data, form.mode.data)
+            return redirect(url_for('university.job_detail', id=job.id))
+        from importer import run_import
+        result = run_import('payments', form.file.data.stream, form.mode.data)
+    return render_template('import_payments.html', form=form, result=result)
+
+# Set-based delete of many students, professors or courses (bulk_delete.py)
+@university_bp.route('/<any(students, professors, courses):name>/bulk-delete', methods=['POST'])
+def bulk_delete_view(name):
+    # JSON body or form: ids (list or comma separated) and/or the resource's filters, dry_run
+    data = request.get_json(silent=True) or request.form
+    if not isinstance(data, dict):
+        return jsonify({'error': "Expected a JSON object"}), 400
+    model, columns = BULK_DELETES[name]
+    ids = data.get('ids') or []
+    if isinstance(ids, str):
+        ids = [value.strip() for value in ids.split(',') if value.strip()]
+    if not isinstance(ids, list) or not all(isinstance(value, (str, int)) and not isinstance(value, bool)
+                                            for value in ids):
+        return jsonify({'error': "ids must be a list of ids or a comma separated string"}), 400
+    if len(ids) > MAX_BULK_IDS:
+        return jsonify({'error': f"At most {MAX_BULK_IDS} ids per request"}), 400
+    try:
+        ids = [model.__mapper__.primary_key[0].type.python_type(value) for value in ids]
+    except ValueError as e:
+        return jsonify({'error': f"Invalid id: {e}"}), 400
+    filters = {arg: data[arg] for arg in columns if data.get(arg)}
+    if not all(isinstance(value, (str, int)) for value in filters.values()):
+        return jsonify({'error': "Filters must be single values"}), 400
+    dry_run = str(data.get('dry_run', request.args.get('dry_run', ''))).lower() in ('1', 'true')
+    try:
+        counts = bulk_delete(name, ids=ids, filters=filters, dry_run=dry_run)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except DeleteRestricted as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify({'deleted': counts, 'dry_run': dry_run})
+
+# Full-text search over students, professors and courses (search.py)
+@university_bp.route('/search')
+@query_budget(2)
+@conditional('student', 'professor', 'course')
+def search_view():
+    q = request.args.get('q', '').strip()
+    kind = request.args.get('kind')
+    kinds = [kind] if kind in SEARCH_INDEXES else None
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', PER_PAGE, type=int), 1), MAX_PER_PAGE)
+    results, has_more = search(q, kinds, limit=per_page, offset=(page - 1) * per_page)
+    if request.args.get('format') == 'json' or request.accept_mimetypes.best == 'application/json':
+        return jsonify({'q': q, 'page': page, 'has_more': has_more,
+                        'results': [{'kind': r['kind'], 'id': r['id'], 'label': r['label'], 'detail': r['detail']}
+                                    for r in results]})
+    return render_template('search.html', q=q, kind=kind if kinds else '', results=results, page=page,
+                           per_page=per_page, has_more=has_more)
+
+# Financial reports, served from the summary tables maintained in summaries.py
+def balance_json(balance):
+    return {'student_id': balance.student_id, 'enrollment_count': balance.enrollment_count,
+            'billed': balance.billed, 'paid': balance.paid, 'pending': balance.pending,
+            'overdue': balance.overdue, 'owed': balance.owed, 'payment_count': balance.payment_count}
+
+def revenue_json(revenue):
+    return {'course_id': revenue.course_id, 'professor_id': revenue.professor_id,
+            'enrollment_count': revenue.enrollment_count, 'billed': revenue.billed, 'paid': revenue.paid,
+            'pending': revenue.pending, 'overdue': revenue.overdue, 'payment_count': revenue.payment_count}
+
+@university_bp.route('/reports')
+@query_budget(5)
+@conditional('tuition_payment', 'enrollment', 'course', 'professor', 'grade_point')
+def reports():
+    return render_template('reports.html', totals=totals(), professors=professor_revenue(),
+                           departments=department_averages())
+
+@university_bp.route('/reports/students/<id>')
+@conditional('student', 'tuition_payment', 'enrollment', 'course')
+def student_balance_report(id):
+    balance = student_balance(id)
+    if balance is None:
+        abort(404)
+    return jsonify(balance_json(balance))
+
+@university_bp.route('/reports/balances')
+@query_budget(2)
+@conditional('student', 'tuition_payment', 'enrollment', 'course')
+def balances_report():
+    page = keyset_paginate(StudentBalance.query, BALANCE_SORTS, StudentBalance.student_id, request.args, default_sort='student')
+    return jsonify({'items': [balance_json(b) for b in page.items], 'next': page.next_cursor, 'prev': page.prev_cursor})
+
+@university_bp.route('/reports/courses')
+@query_budget(2)
+@conditional('tuition_payment', 'enrollment', 'course')
+def course_revenue_report():
+    query = CourseRevenue.query
+    if request.args.get('professor'):
+        query = query.filter(CourseRevenue.professor_id == request.args['professor'])
+    page = keyset_paginate(query, REVENUE_SORTS, CourseRevenue.course_id, request.args, default_sort='course')
+    return jsonify({'items': [revenue_json(r) for r in page.items], 'next': page.next_cursor, 'prev': page.prev_cursor})
+
+# Grade analytics (analytics.py), cached per enrollment/course/professor version
+@university_bp.route('/reports/students/<id>/transcript')
+@conditional('enrollment', 'course', 'student', 'grade_point')
+def transcript_report(id):
+    result = transcript(id)
+    if result is None:
+        abort(404)
+    return jsonify(result)
+
+@university_bp.route('/reports/courses/<int:id>/grades')
+@conditional('enrollment', 'course', 'grade_point')
+def course_grades_report(id):
+    return jsonify({'course_id': id, 'grades': course_grades(id)})
+
+@university_bp.route('/reports/professors/<id>/grades')
+@conditional('enrollment', 'course', 'grade_point')
+def professor_grades_report(id):
+    return jsonify({'professor_id': id, 'grades': professor_grades(id)})
+
+@university_bp.route('/reports/departments')
+@conditional('enrollment', 'course', 'professor', 'grade_point')
+def department_report():
+    return jsonify(department_averages())
+
+# Background jobs
+@university_bp.route('/jobs/<id>')
+def job_detail(id):
+    from jobs import job_status
+    with db.engine.begin() as connection:
+        fail_orphaned_jobs(connection, [id])
+    job = job_status(Job.query.get_or_404(id))
+    if request.args.get('format') == 'json' or request.accept_mimetypes.best == 'application/json':
+        return jsonify(job)
+    download_url = url_for('university.download_job_artifact', id=id) if job['status'] == 'done' and job['kind'] == 'export' else None
+    return render_template('job.html', job=job, download_url=download_url)
+
+@university_bp.route('/jobs/<id>/download')
+def download_job_artifact(id):
+    job = Job.query.get_or_404(id)
+    if not job.artifact:
+        abort(404)
+    from jobs import job_dir
+    return send_from_directory(job_dir(), job.artifact, as_attachment=True, download_name=job.artifact.split('.', 1)[1])
 
 # Gallery routes
 @university_bp.route('/gallery')
 def gallery():
-    campus_images = os.listdir('static/uploads/campus') if os.path.exists('static/uploads/campus') else []
-    academic_images = os.listdir('static/uploads/academic') if os.path.exists('static/uploads/academic') else []
-    student_images = os.listdir('static/uploads/student') if os.path.exists('static/uploads/student') else []
+    campus_images = gallery_index.images('campus')
+    academic_images = gallery_index.images('academic')
+    student_images = gallery_index.images('student')
     return render_template('gallery.html', campus_images=campus_images, academic_images=academic_images, student_images=student_images)
 
 @university_bp.route('/gallery/upload/<category>', methods=['POST'])
 def upload_image(category):
-    if 'file' not in request.files:
-        return redirect(url_for('university.gallery'))
-    file = request.files['file']
-    if file.filename == '':
-        return redirect(url_for('university.gallery'))
-    if file:
-        filename = file.filename
-        file.save(os.path.join(f'static/uploads/{category}', filename))
+    if category not in GALLERY_CATEGORIES:
+        abort(404)
+    filename = store_upload(category, request.environ)
+    if filename:
+        make_thumbnails(category, filename, force=True)
+        gallery_index.invalidate(category)
     return redirect(url_for('university.gallery'))
 
 @university_bp.route('/gallery/download/<category>/<filename>')
 def download_image(category, filename):
-    return send_from_directory(f'static/uploads/{category}', filename, as_attachment=True)
\ No newline at end of file
+    # ?v=<sha256> names the content and is served as immutable; a name alone is redirected
+    # there, since a later upload may point the name at different content
+    digest = request.args.get('v', '')
+    if BLOB_NAME.fullmatch(digest) and os.path.exists(blob_path(digest)):
+        return send_blob(digest, filename)
+    image = gallery_index.lookup(category, filename) if category in GALLERY_CATEGORIES else None
+    if image is None:
+        abort(404)
+    return redirect(url_for('university.download_image', category=category, filename=filename, v=image['sha256']))
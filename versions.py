@@ -0,0 +1,116 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import request, make_response
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from database import db
+from models import TableVersion
+
+VERSIONED_TABLES = {'student', 'professor', 'course', 'enrollment', 'tuition_payment', 'grade_point'}
+HTML_CACHE_SIZE = 128
+HTML_CACHE_MAX_BYTES = 2 * 1024 * 1024
+
+
+def bump_versions(connection, tables):
+    tables = sorted(set(tables) & VERSIONED_TABLES)
+    if not tables:
+        return
+    bump = text("UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP "
+                "WHERE name = :name")
+    for name in tables:
+        if connection.execute(bump, {'name': name}).rowcount == 0:
+            connection.execute(text("INSERT OR IGNORE INTO table_version (name, version, updated_at) "
+                                    "VALUES (:name, 1, CURRENT_TIMESTAMP)"), {'name': name})
+
+
+def get_versions(tables):
+    # {table: (version, updated_at)}; one indexed read of a handful of rows
+    rows = db.session.execute(
+        db.select(TableVersion.name, TableVersion.version, TableVersion.updated_at)
+        .where(TableVersion.name.in_(tables))
+    ).all()
+    found = {name: (version, updated_at) for name, version, updated_at in rows}
+    return {name: found.get(name, (0, None)) for name in tables}
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_after_flush(session, flush_context):
+    changed = list(session.new) + list(session.deleted) + [obj for obj in session.dirty if session.is_modified(obj)]
+    tables = {obj.__table__.name for obj in changed if hasattr(obj, '__table__')}
+    if tables & VERSIONED_TABLES:
+        bump_versions(session.connection(), tables)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _bump_for_bulk_statement(orm_execute_state):
+    # Core insert/update/delete run through the session (bulk imports, bulk deletes)
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if table is not None and table.name in VERSIONED_TABLES:
+            bump_versions(orm_execute_state.session.connection(), {table.name})
+
+
+class HtmlCache:
+    def __init__(self, size=HTML_CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, body, mimetype):
+        if len(body) > HTML_CACHE_MAX_BYTES:
+            return
+        with self._lock:
+            self._entries[key] = (body, mimetype)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+html_cache = HtmlCache()
+
+
+def conditional(*tables, cache_html=True):
+    # Strong ETag derived from the versions of the tables a view reads. A matching
+    # If-None-Match gets a 304 without running the view; otherwise a rendered page for the
+    # same (route, arguments, versions) is served from html_cache. No Last-Modified: its
+    # one-second granularity would let a change made in the same second answer 304.
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            versions = get_versions(tables)
+            # Views may negotiate JSON/NDJSON on the Accept header
+            key = (request.endpoint, tuple(sorted(kwargs.items())),
+                   tuple(sorted(request.args.items(multi=True))),
+                   request.accept_mimetypes.best, tuple(versions.values()))
+            etag = hashlib.sha1(repr(key).encode()).hexdigest()
+            if request.if_none_match.contains(etag):
+                response = make_response('', 304)
+            else:
+                cached = html_cache.get(key) if cache_html else None
+                if cached is not None:
+                    body, mimetype = cached
+                    response = make_response(body)
+                    response.mimetype = mimetype
+                else:
+                    response = make_response(view(*args, **kwargs))
+                    if cache_html and response.status_code == 200 and not response.is_streamed:
+                        html_cache.put(key, response.get_data(), response.mimetype)
+            response.set_etag(etag)
+            response.cache_control.no_cache = True
+            response.vary.add('Accept')
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,4 @@
+import startup  # first, so startup timing covers the app's own imports
+from app import create_app
+
+app = create_app()